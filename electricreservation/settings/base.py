@@ -95,6 +95,10 @@ STATIC_URL = '/static/'
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
+# Mean temperature of every month, January first. When set, the driving range of a car follows the temperature
+# between its winter range in the coldest month and its summer range in the warmest one.
+DRIVING_RANGE_TEMPERATURES = None
+
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
@@ -30,6 +30,7 @@ CACHES = {
 }
 
 MIDDLEWARE = [
+    'reservation.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -38,3 +39,5 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
+
+REQUEST_METRICS_SAMPLE_RATE = 1.0
@@ -61,6 +61,7 @@ SECURE_BROWSER_XSS_FILTER = True
 MIDDLEWARE = [
     # 'django.middleware.cache.UpdateCacheMiddleware',
     'django.middleware.gzip.GZipMiddleware',
+    'reservation.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -75,3 +76,5 @@ CONN_MAX_AGE = 60
 
 STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.CachedStaticFilesStorage'
 
+# Only measure one request in ten, the measurements are kept in memory
+REQUEST_METRICS_SAMPLE_RATE = 0.1
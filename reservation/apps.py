@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ReservationConfig(AppConfig):
     name = 'reservation'
+
+    def ready(self):
+        # Connect the signal receivers that publish booking changes to the update streams
+        from reservation import updates  # noqa: F401
@@ -0,0 +1,111 @@
+import functools
+import gzip
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import ImproperlyConfigured
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Only the plugins the calendar uses. English is built into the core, so Dutch is the only locale to add.
+BUNDLES = {
+    'calendar.js': [
+        'reservation/fullcalendar/core/main.min.js',
+        'reservation/fullcalendar/core/locales/nl.js',
+        'reservation/fullcalendar/interaction/main.min.js',
+        'reservation/fullcalendar/daygrid/main.min.js',
+        'reservation/fullcalendar/timegrid/main.min.js',
+        'reservation/fullcalendar/bootstrap/main.min.js',
+    ],
+    'calendar.css': [
+        'reservation/fullcalendar/core/main.min.css',
+        'reservation/fullcalendar/daygrid/main.min.css',
+        'reservation/fullcalendar/timegrid/main.min.css',
+        'reservation/fullcalendar/bootstrap/main.min.css',
+    ],
+}
+BUNDLE_DIR = 'reservation/bundles'
+MANIFEST_NAME = 'manifest.json'
+
+
+def get_bundle_root():
+    if not settings.STATIC_ROOT:
+        raise ImproperlyConfigured("The asset bundles are built in STATIC_ROOT, which is not set")
+    return os.path.join(settings.STATIC_ROOT, BUNDLE_DIR)
+
+
+def minify(content):
+    # The files that aren't minified yet are locales, which have no multiline strings, so every line can be stripped
+    return '\n'.join(line.strip() for line in content.splitlines() if line.strip())
+
+
+def read_source(path):
+    absolute_path = finders.find(path)
+    if absolute_path is None:
+        raise ImproperlyConfigured(f"Static file {path} of the asset bundles not found")
+    with open(absolute_path, encoding='utf-8') as f:
+        content = f.read()
+    return content if '.min.' in path else minify(content)
+
+
+def build_bundle(name):
+    """Return the hashed file name and the content of bundle name."""
+    # The semicolons keep a file without one at the end from running into the next
+    separator = ';\n' if name.endswith('.js') else '\n'
+    content = separator.join(read_source(path) for path in BUNDLES[name]).encode()
+    base, extension = os.path.splitext(name)
+    return f'{base}.{hashlib.md5(content).hexdigest()[:12]}{extension}', content
+
+
+def write_bundle(root, file_name, content):
+    """Write the bundle and its compressed variants, return the names of the files written."""
+    files = {file_name: content, f'{file_name}.gz': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        files[f'{file_name}.br'] = brotli.compress(content)
+    for name, data in files.items():
+        with open(os.path.join(root, name), 'wb') as f:
+            f.write(data)
+    return list(files)
+
+
+def build_bundles():
+    """
+    Build every bundle in the bundle directory of STATIC_ROOT and return the manifest.
+
+    Bundles of earlier builds are left in place, so pages rendered before the build still load.
+    """
+    root = get_bundle_root()
+    os.makedirs(root, exist_ok=True)
+    manifest = {}
+    for name in BUNDLES:
+        file_name, content = build_bundle(name)
+        write_bundle(root, file_name, content)
+        manifest[name] = f'{BUNDLE_DIR}/{file_name}'
+    with open(os.path.join(root, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+@functools.lru_cache(maxsize=4)
+def read_manifest(path, modified_time):
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_manifest():
+    """Return the manifest of the last build, or None when the bundles were never built."""
+    if not settings.STATIC_ROOT:
+        return None
+    path = os.path.join(settings.STATIC_ROOT, BUNDLE_DIR, MANIFEST_NAME)
+    try:
+        modified_time = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    return read_manifest(path, modified_time)
+
@@ -0,0 +1,54 @@
+from django.db.models import CharField, Value
+
+from reservation.cache import get_or_set_for_car
+from reservation.models import Reservation, ChargingReservation, occurring, overlapping
+from reservation.recurrence import expand_rows
+
+
+def get_busy_car_ids(car_ids, start_time, end_time):
+    """Return the ids of the cars in car_ids with a booking between start_time and end_time, with one query."""
+    reservations = Reservation.objects \
+        .filter(occurring(start_time, end_time), car_id__in=car_ids) \
+        .values_list('start_time', 'end_time', 'recurrence', 'car_id')
+    charging_reservations = ChargingReservation.objects \
+        .filter(overlapping(start_time, end_time), car_id__in=car_ids) \
+        .annotate(recurrence=Value('', output_field=CharField())) \
+        .values_list('start_time', 'end_time', 'recurrence', 'car_id')
+    # Only the occurrences of a series in the window are expanded, so every booking left overlaps it
+    return {car_id for _, _, car_id
+            in expand_rows(reservations.union(charging_reservations, all=True), start_time, end_time)}
+
+
+def get_distance_left(car, time):
+    # Shares the cache entries of the distance left API of the car
+    return get_or_set_for_car(car.id, 'distance_left', [time], lambda: {
+        'distance_left': car.get_distance_left(time),
+        'driving_range': car.get_driving_range(time),
+    })
+
+
+def get_availability(cars, start_time, end_time, distance=0):
+    """
+    Return for every car whether it is free between start_time and end_time with at least distance left.
+
+    Available cars come first, ranked by the distance left at start_time. The distance left is only computed for
+    the cars that are free.
+    """
+    busy_car_ids = get_busy_car_ids([car.id for car in cars], start_time, end_time)
+    availability = []
+    for car in cars:
+        entry = {
+            'id': car.id,
+            'name': car.name,
+            'free': car.id not in busy_car_ids,
+            'distance_left': None,
+            'driving_range': car.get_driving_range(start_time),
+        }
+        if entry['free']:
+            entry.update(get_distance_left(car, start_time))
+        entry['available'] = entry['free'] and entry['distance_left'] >= distance
+        availability.append(entry)
+
+    availability.sort(key=lambda entry: (not entry['available'], not entry['free'],
+                                         -(entry['distance_left'] or 0), entry['name']))
+    return availability
@@ -0,0 +1,133 @@
+import bisect
+import itertools
+
+from django.db.models import Q
+
+from reservation.recurrence import expand_rows
+
+
+class BatteryTimeline:
+    """Battery state of a car between start_time and end_time, loaded with a fixed number of queries.
+
+    distance_left(time) gives the same result as Car.get_distance_left(time) for any time in the window.
+    """
+
+    def __init__(self, car, start_time, end_time, exclude_reservation_id=None, extra_reservations=()):
+        self.car = car
+        self.start_time = start_time
+        self.end_time = end_time
+
+        self.anchor = anchor = car.get_last_charging_time_before(start_time)
+
+        charge_ends = set()
+        partial_charges = []
+        charging_reservations = car.chargingreservation_set \
+            .filter(end_time__gte=anchor, end_time__lte=end_time) \
+            .values_list('start_time', 'end_time')
+        for charge_start_time, charge_end_time in charging_reservations:
+            if car.is_full_charge(charge_start_time, charge_end_time):
+                charge_ends.add(charge_end_time)
+            else:
+                partial_charges.append((charge_end_time, car.get_charged_distance(charge_start_time, charge_end_time)))
+        self.charge_ends = [anchor] + sorted(time for time in charge_ends if time > anchor)
+
+        queryset = car.reservation_set
+        if exclude_reservation_id is not None:
+            queryset = queryset.exclude(pk=exclude_reservation_id)
+        reservations = queryset \
+            .filter(Q(end_time__gte=anchor) | Q(recurrence_end_time__gte=anchor), start_time__lte=end_time) \
+            .values_list('start_time', 'end_time', 'recurrence', 'distance')
+        reservations = [r for r in expand_rows(reservations, anchor, end_time) if r[0] <= end_time]
+        # Reservations that are not saved yet, as (start time, end time, distance)
+        extra_reservations = [r for r in extra_reservations if r[1] >= anchor and r[0] <= end_time]
+
+        # Per cycle, the times of its changes and the distance driven after each of them
+        self.cycles = []
+        for changes in split_in_cycles(self.charge_ends, reservations + extra_reservations, partial_charges):
+            self.cycles.append(([time for time, _ in changes],
+                                get_distances_driven([change for _, change in changes])))
+
+    def get_last_charging_time_before(self, time):
+        return self.charge_ends[max(bisect.bisect_right(self.charge_ends, time) - 1, 0)]
+
+    def get_distance_driven(self, time):
+        times, distances_driven = self.cycles[max(bisect.bisect_right(self.charge_ends, time) - 1, 0)]
+        index = bisect.bisect_right(times, time)
+        return distances_driven[index - 1] if index else 0
+
+    def get_distance_left(self, time):
+        return self.car.get_driving_range(time) - self.get_distance_driven(time)
+
+    def get_distance_left_map(self, reservations):
+        # Occurrences of a recurring reservation share its id, so they are told apart by their start time
+        return {(reservation.id, reservation.start_time): self.get_distance_left(reservation.start_time)
+                for reservation in reservations}
+
+
+def get_distance_left_for_reservations(car, reservations):
+    if not reservations:
+        return {}
+    timeline = BatteryTimeline(car,
+                               min(reservation.start_time for reservation in reservations),
+                               max(reservation.start_time for reservation in reservations))
+    return timeline.get_distance_left_map(reservations)
+
+
+def get_distances_driven(changes):
+    """Return the distance driven after each change of a battery cycle.
+
+    A change is the distance of a reservation, or minus the distance a partial charge restores. Charging stops
+    when the battery is full, so the distance driven never drops below zero: it is the running sum of the changes
+    minus the lowest running sum so far.
+    """
+    sums = list(itertools.accumulate(changes))
+    return [total - min(lowest, 0) for total, lowest in zip(sums, itertools.accumulate(sums, min))]
+
+
+def split_in_cycles(cycle_starts, reservations, partial_charges=()):
+    """Return the changes of every cycle as (time, change) in time order.
+
+    A reservation counts when it ends, in the cycle it starts in, and not at all when it is still running when the
+    next cycle starts. partial_charges holds (end time, distance restored).
+    """
+    cycles = [[] for _ in cycle_starts]
+    for start_time, end_time, distance in reservations:
+        index = bisect.bisect_right(cycle_starts, start_time) - 1
+        if index < 0:
+            continue
+        if index + 1 < len(cycle_starts) and end_time > cycle_starts[index + 1]:
+            continue
+        cycles[index].append((end_time, distance))
+    for end_time, charged_distance in partial_charges:
+        index = bisect.bisect_right(cycle_starts, end_time) - 1
+        if index >= 0:
+            cycles[index].append((end_time, -charged_distance))
+    for changes in cycles:
+        changes.sort()
+    return cycles
+
+
+def get_battery_cycles(charges, reservations, partial_charges=()):
+    """Split a car's timeline into battery cycles, one per full charge.
+
+    charges holds (charging reservation id, end time) of the full charges, reservations holds
+    (start time, end time, distance) and partial_charges holds (end time, distance restored) of the charges that
+    are too short to fill the battery. Returns (charging reservation id, start time, end time, distance driven,
+    last reservation end time) per cycle, where a cycle runs from the end of its charge to the end of the next one.
+    The last reservation end time is the time of the last change in the cycle, a partial charge included.
+    """
+    unique_charges = []
+    for charge in sorted(charges, key=lambda charge: charge[1]):
+        if not unique_charges or charge[1] != unique_charges[-1][1]:
+            unique_charges.append(charge)
+    charges = unique_charges
+    cycle_starts = [charge[1] for charge in charges]
+
+    cycles = []
+    for index, ((charging_reservation_id, start_time), changes) in enumerate(
+            zip(charges, split_in_cycles(cycle_starts, reservations, partial_charges))):
+        end_time = cycle_starts[index + 1] if index + 1 < len(cycle_starts) else None
+        distance_driven = get_distances_driven([change for _, change in changes])[-1] if changes else 0
+        last_change_time = max(time for time, _ in changes) if changes else None
+        cycles.append((charging_reservation_id, start_time, end_time, distance_driven, last_change_time))
+    return cycles
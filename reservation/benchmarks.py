@@ -0,0 +1,197 @@
+import datetime
+import random
+import statistics
+import time
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from reservation.cache import bump_car_generation
+from reservation.forms import ReservationAddForm
+from reservation.models import Car, Reservation, ChargingReservation, BatteryCycle
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed_dense_calendar(start_time, days, seed=0):
+    """Create a car whose calendar is booked back to back, with a short gap now and then."""
+    rng = random.Random(seed)
+    user = User.objects.create(username=f'benchmark-{seed}')
+    car = Car.objects.create(name='Benchmark', summer_driving_range=300, winter_driving_range=200,
+                             charging_time=4)
+    car.users.add(user)
+
+    reservations = []
+    charging_reservations = []
+    current_time = start_time
+    end_time = start_time + datetime.timedelta(days=days)
+    while current_time < end_time:
+        duration = datetime.timedelta(minutes=30 * rng.randint(1, 6))
+        if rng.random() < 0.05:
+            charging_reservations.append(ChargingReservation(car=car, start_time=current_time,
+                                                             end_time=current_time + duration))
+        else:
+            reservations.append(Reservation(owner=user, car=car, distance=rng.randint(1, 30), location='Benchmark',
+                                            start_time=current_time, end_time=current_time + duration))
+        current_time += duration
+        if rng.random() < 0.1:
+            current_time += datetime.timedelta(minutes=30 * rng.randint(1, 8))
+
+    Reservation.objects.bulk_create(reservations)
+    ChargingReservation.objects.bulk_create(charging_reservations)
+    BatteryCycle.rebuild(car)
+    return car
+
+
+def find_charging_slot_stepwise(car, time, exclude_reservation_id=None):
+    """The original find_charging_slot, which checks every half hour slot with its own queries."""
+    if car.get_distance_left(time) == car.get_driving_range(time):
+        return None
+
+    last_charging_time = car.get_last_charging_time_before(time)
+    min_search_time = time - datetime.timedelta(days=3)
+
+    dt_start_of_hour = time.replace(minute=0, second=0, microsecond=0)
+    dt_half_hour = time.replace(minute=30, second=0, microsecond=0)
+    if time >= dt_half_hour:
+        current_end_time = dt_half_hour
+    else:
+        current_end_time = dt_start_of_hour
+
+    current_start_time = current_end_time - datetime.timedelta(hours=car.charging_time)
+    while current_start_time > last_charging_time and current_start_time > min_search_time:
+        if car.time_slot_free(current_start_time, current_end_time, exclude_reservation_id=exclude_reservation_id):
+            return current_start_time - datetime.timedelta(minutes=30)
+        current_start_time = current_start_time - datetime.timedelta(minutes=30)
+        current_end_time = current_end_time - datetime.timedelta(minutes=30)
+    return None
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def measure(function, *args, **kwargs):
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        start = time.perf_counter()
+        result = function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+    return result, counter.count, elapsed
+
+
+def find_free_intervals(car):
+    """Return the gaps between the bookings of a car, in chronological order."""
+    bookings = sorted(list(car.reservation_set.values_list('start_time', 'end_time')) +
+                      list(car.chargingreservation_set.values_list('start_time', 'end_time')))
+    free_intervals = []
+    for (_, previous_end_time), (next_start_time, _) in zip(bookings, bookings[1:]):
+        if next_start_time > previous_end_time:
+            free_intervals.append((previous_end_time, next_start_time))
+    return free_intervals
+
+
+def summarize(queries, seconds):
+    milliseconds = sorted(second * 1000 for second in seconds)
+    return {
+        'samples': len(milliseconds),
+        'queries': max(queries),
+        'mean_queries': statistics.mean(queries),
+        'mean_ms': round(statistics.mean(milliseconds), 3),
+        'median_ms': round(statistics.median(milliseconds), 3),
+        'max_ms': round(milliseconds[-1], 3),
+    }
+
+
+def run_benchmarks(days=365, samples=20, seed=0):
+    """
+    Seed a dense calendar and measure the query count and wall time of the hot paths of the app.
+
+    Everything happens inside a transaction that is rolled back, so this can safely run against any database.
+    The per-car cache is invalidated before every sample, so the numbers are those of a cold cache.
+    """
+    start_time = timezone.make_aware(datetime.datetime(2019, 6, 1))
+    rng = random.Random(seed)
+    results = {}
+
+    try:
+        with transaction.atomic(), override_settings(ALLOWED_HOSTS=['testserver'], SECURE_SSL_REDIRECT=False):
+            car = seed_dense_calendar(start_time, days, seed=seed)
+            owner = car.users.get()
+            client = Client()
+            client.force_login(owner)
+            free_intervals = find_free_intervals(car)
+
+            def get(name, **params):
+                response = client.get(reverse(name, kwargs={'pk': car.id}), params)
+                if response.status_code != 200:
+                    raise AssertionError(f"{name} returned status {response.status_code}")
+
+            def reservations_list(time):
+                get('reservation:api_car_reservations', start=time.isoformat(),
+                    end=(time + datetime.timedelta(days=7)).isoformat())
+
+            def charging_reservations_list(time):
+                get('reservation:api_car_charging_reservations', start=time.isoformat(),
+                    end=(time + datetime.timedelta(days=7)).isoformat())
+
+            def distance_left(time):
+                get('reservation:api_car_distance_left', time=int(time.timestamp()))
+
+            def check_charging_slot(time, slot):
+                # In UTC, the half hour steps are half an hour apart on the nights the clocks change as well
+                expected = find_charging_slot_stepwise(car, time.astimezone(datetime.timezone.utc))
+                if slot != expected:
+                    raise AssertionError(f"find_charging_slot({time}) returned {slot}, expected {expected}")
+
+            def reservation_add_form_save(time):
+                free_start_time, free_end_time = rng.choice(free_intervals)
+                form = ReservationAddForm({
+                    'description': 'Benchmark',
+                    'distance': 250,
+                    'location': 'Benchmark',
+                    'start_time': timezone.localtime(free_start_time).strftime('%Y-%m-%d %H:%M'),
+                    'end_time': timezone.localtime(free_end_time).strftime('%Y-%m-%d %H:%M'),
+                    'priority': Reservation.PRIORITY_LOW,
+                }, car=car, owner=owner)
+                with transaction.atomic():
+                    if not form.is_valid():
+                        raise AssertionError(f"ReservationAddForm is invalid: {form.errors.as_text()}")
+                    form.save()
+                    transaction.set_rollback(True)
+
+            cases = {
+                'api_reservations': reservations_list,
+                'api_charging_reservations': charging_reservations_list,
+                'api_distance_left': distance_left,
+                'find_charging_slot': car.find_charging_slot,
+                'reservation_add_form_save': reservation_add_form_save,
+            }
+            # Results are checked outside of the measurement
+            checks = {'find_charging_slot': check_charging_slot}
+            for name, function in cases.items():
+                queries, seconds = [], []
+                for _ in range(samples):
+                    sample_time = start_time + datetime.timedelta(minutes=30 * rng.randrange(3 * 48, days * 48))
+                    bump_car_generation(car.id)
+                    result, sample_queries, sample_seconds = measure(function, sample_time)
+                    if name in checks:
+                        checks[name](sample_time, result)
+                    queries.append(sample_queries)
+                    seconds.append(sample_seconds)
+                results[name] = summarize(queries, seconds)
+            raise Rollback
+    except Rollback:
+        pass
+
+    return results
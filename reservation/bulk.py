@@ -0,0 +1,169 @@
+import bisect
+import csv
+import io
+import json
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from reservation.battery import BatteryTimeline
+from reservation.cache import bump_car_generation
+from reservation.forms import ReservationAddForm
+from reservation.models import BatteryCycle, lock_car
+from reservation.recurrence import intervals_overlap
+from reservation.updates import broker
+
+FIELDS = ('start_time', 'end_time', 'distance', 'location', 'description', 'priority', 'recurrence')
+FORMATS = ('csv', 'json')
+CHUNK_SIZE = 500
+
+
+class BulkFormatError(ValueError):
+    pass
+
+
+def parse_rows(content, content_format):
+    if content_format == 'json':
+        try:
+            rows = json.loads(content)
+        except ValueError:
+            raise BulkFormatError(_("The file is not valid JSON"))
+        if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+            raise BulkFormatError(_("Expected a list of reservations"))
+        return rows
+    elif content_format == 'csv':
+        return list(csv.DictReader(io.StringIO(content)))
+    raise BulkFormatError(_("Unknown format: %(format)s") % {'format': content_format})
+
+
+def import_reservations(car, owner, rows, dry_run=False):
+    """
+    Validate and create the reservations of rows for car, and return a report per row, in the order of rows.
+
+    Rows are validated with ReservationAddForm, then checked for overlaps with the bookings of the car and with
+    each other in one sweep in start time order. Valid rows are created with a single bulk_create. Unlike adding
+    a single reservation, no charging reservations are added; rows without enough distance left get a warning.
+    """
+    report = [{'row': number, 'status': 'invalid'} for number in range(1, len(rows) + 1)]
+    candidates = []
+    for entry, row in zip(report, rows):
+        form = ReservationAddForm({field: row[field] for field in FIELDS if field in row}, car=car, owner=owner)
+        if form.is_valid():
+            candidates.append((entry, form.save(commit=False)))
+        else:
+            entry['errors'] = {field: list(errors) for field, errors in form.errors.items()}
+    candidates.sort(key=lambda candidate: candidate[1].start_time)
+
+    with transaction.atomic():
+        lock_car(car.id)
+        accepted = sweep_overlaps(car, candidates)
+        check_distance_left(car, accepted)
+
+        reservations = [reservation for _, reservation in accepted]
+        if not dry_run and reservations:
+            car.reservation_set.bulk_create(reservations)
+            # bulk_create sends no signals, so do what the post_save receivers would have done
+            BatteryCycle.rebuild(car, since=reservations[0].start_time)
+            transaction.on_commit(lambda: bump_car_generation(car.id))
+            transaction.on_commit(lambda: broker.publish(car.id))
+
+    for entry, reservation in accepted:
+        entry['status'] = 'valid' if dry_run else 'created'
+        if not dry_run and reservation.pk is not None:
+            entry['id'] = reservation.pk
+    return report
+
+
+def sweep_overlaps(car, candidates):
+    """Return the candidates that overlap neither an existing booking nor an earlier candidate."""
+    if not candidates:
+        return []
+    for entry, reservation in candidates:
+        reservation.update_recurrence_end_time()
+    occupied = car.get_occupied_intervals(
+        candidates[0][1].start_time,
+        max(reservation.recurrence_end_time or reservation.end_time for _, reservation in candidates))
+
+    # The occurrences of the accepted candidates as (start time, end time, row), sorted by start time. They never
+    # overlap, so they are sorted by end time as well.
+    accepted_occurrences = []
+    accepted = []
+    for entry, reservation in candidates:
+        occurrences = reservation.get_occurrences()
+        if intervals_overlap(occurrences, occupied):
+            entry['status'] = 'overlap'
+            entry['errors'] = {'__all__': [_("Reservation overlaps with another reservation")]}
+            continue
+
+        row = get_overlapping_row(accepted_occurrences, occurrences)
+        if row is not None:
+            entry['status'] = 'overlap'
+            entry['errors'] = {'__all__': [_("Reservation overlaps with row %(row)s") % {'row': row}]}
+            continue
+
+        for start_time, end_time in occurrences:
+            bisect.insort(accepted_occurrences, (start_time, end_time, entry['row']))
+        accepted.append((entry, reservation))
+    return accepted
+
+
+def get_overlapping_row(accepted_occurrences, occurrences):
+    for start_time, end_time in occurrences:
+        index = bisect.bisect_left(accepted_occurrences, (end_time,))
+        if index > 0 and accepted_occurrences[index - 1][1] > start_time:
+            return accepted_occurrences[index - 1][2]
+    return None
+
+
+def check_distance_left(car, accepted):
+    if not accepted:
+        return
+    occurrences = [(entry, reservation, start_time, end_time) for entry, reservation in accepted
+                   for start_time, end_time in reservation.get_occurrences()]
+    timeline = BatteryTimeline(car, accepted[0][1].start_time, max(occurrence[2] for occurrence in occurrences),
+                               extra_reservations=[(start_time, end_time, reservation.distance)
+                                                   for _, reservation, start_time, end_time in occurrences])
+    for entry, reservation, start_time, end_time in occurrences:
+        distance_left = timeline.get_distance_left(start_time)
+        # A series reports the occurrence with the least distance left
+        if 'distance_left' not in entry or distance_left < entry['distance_left']:
+            entry['distance_left'] = distance_left
+        if distance_left < reservation.distance:
+            entry['warnings'] = [_("Not enough distance left for this reservation")]
+
+
+def format_time(time):
+    return timezone.localtime(time).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def export_row(reservation):
+    return {
+        'start_time': format_time(reservation.start_time),
+        'end_time': format_time(reservation.end_time),
+        'distance': reservation.distance,
+        'location': reservation.location,
+        'description': reservation.description,
+        'priority': reservation.priority,
+        'recurrence': reservation.recurrence,
+    }
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def iter_export(car, content_format):
+    """Yield the reservations of car in the format import_reservations reads, a chunk of rows at a time."""
+    reservations = car.reservation_set.order_by('start_time').iterator(chunk_size=CHUNK_SIZE)
+    if content_format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(FIELDS)
+        for reservation in reservations:
+            yield writer.writerow(export_row(reservation)[field] for field in FIELDS)
+    else:
+        yield '['
+        for index, reservation in enumerate(reservations):
+            yield (',\n' if index else '\n') + json.dumps(export_row(reservation))
+        yield '\n]\n'
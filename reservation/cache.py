@@ -0,0 +1,46 @@
+import time
+
+from django.core.cache import cache
+
+CACHE_TIMEOUT = 60 * 60 * 24
+
+
+def get_generation_key(car_id):
+    return f'reservation:car:{car_id}:generation'
+
+
+def get_car_generation(car_id):
+    generation = cache.get(get_generation_key(car_id))
+    if generation is None:
+        # Start from the current time rather than 0, so entries left over from before an eviction are never reused
+        cache.add(get_generation_key(car_id), time.time_ns(), None)
+        generation = cache.get(get_generation_key(car_id))
+    return generation
+
+
+def bump_car_generation(car_id):
+    try:
+        cache.incr(get_generation_key(car_id))
+    except ValueError:
+        cache.set(get_generation_key(car_id), time.time_ns(), None)
+
+
+def get_car_cache_key(car_id, name, *args):
+    parts = [str(arg.isoformat() if hasattr(arg, 'isoformat') else arg) for arg in args]
+    return ':'.join(['reservation:car', str(car_id), str(get_car_generation(car_id)), name] + parts)
+
+
+def get_or_set_for_car(car_id, name, args, default):
+    return cache.get_or_set(get_car_cache_key(car_id, name, *args), default, CACHE_TIMEOUT)
+
+
+def get_user_car_ids_key(user_id):
+    return f'reservation:user:{user_id}:car_ids'
+
+
+def get_user_car_ids(user_id, default):
+    return cache.get_or_set(get_user_car_ids_key(user_id), default, CACHE_TIMEOUT)
+
+
+def delete_user_car_ids(user_id):
+    cache.delete(get_user_car_ids_key(user_id))
@@ -1,24 +1,23 @@
-import datetime
-
 from crispy_forms.helper import FormHelper
 from crispy_forms.layout import Submit, Button
 from django import forms
-from django.contrib import messages
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext as _
 
 from reservation.models import Reservation, ChargingReservation
+from reservation.recurrence import expand, occurrences_overlap, validate_occurrence_count, validate_recurrence
+from reservation.services import ReservationService
 
 
 class ReservationAddForm(forms.ModelForm):
     class Meta:
-        fields = ('description', 'distance', 'location', 'start_time', 'end_time', 'priority')
+        fields = ('description', 'distance', 'location', 'start_time', 'end_time', 'priority', 'recurrence')
         model = Reservation
 
     def __init__(self, *args, **kwargs):
         self.car = kwargs.pop('car')
         self.owner = kwargs.pop('owner')
-        self.request = kwargs.pop('request')
+        self.result = None
 
         super().__init__(*args, **kwargs)
 
@@ -30,47 +29,30 @@ class ReservationAddForm(forms.ModelForm):
         instance.car = self.car
         instance.owner = self.owner
         if commit:
-            instance.save()
+            self.result = ReservationService(self.car).save(instance)
         return instance
 
     def clean(self):
-        start_time = self.cleaned_data['start_time']
-        end_time = self.cleaned_data['end_time']
+        start_time = self.cleaned_data.get('start_time')
+        end_time = self.cleaned_data.get('end_time')
 
         # Check start_time < end_time
-        if start_time >= end_time:
+        if start_time and end_time and start_time >= end_time:
             raise ValidationError(_("End time must come after start time"))
 
-        # Check overlap
-        if not self.car.time_slot_free(start_time, end_time):
-            raise ValidationError(_("Reservation overlaps with another reservation"))
-
-        # Check if we could create a new charging reservation
-        if self.car.get_distance_left(start_time) < self.cleaned_data['distance']:
-            charging_slot = self.car.find_charging_slot(start_time)
-            if charging_slot is not None:
-                charging_reservation = ChargingReservation(car=self.car,
-                                                           start_time=charging_slot,
-                                                           end_time=charging_slot + datetime.timedelta(
-                                                               hours=self.car.charging_time))
-                charging_reservation.save()
-                messages.info(
-                    self.request,
-                    _("We automatically added a charging reservation at %(charging_time)s.")
-                    % {'charging_time': charging_slot.strftime('%d %b %Y %H:%M:%S')}
-                )
+        check_recurrence(self.cleaned_data.get('recurrence'), start_time, end_time)
 
 
 class ReservationDetailForm(forms.ModelForm):
     class Meta:
-        fields = ('description', 'distance', 'location', 'start_time', 'end_time', 'priority')
+        fields = ('description', 'distance', 'location', 'start_time', 'end_time', 'priority', 'recurrence')
         model = Reservation
 
     def __init__(self, *args, **kwargs):
         self.car = kwargs.pop('car')
         self.owner = kwargs.pop('owner')
         self.id = kwargs.pop('id')
-        self.request = kwargs.pop('request')
+        self.result = None
 
         super(ReservationDetailForm, self).__init__(*args, **kwargs)
 
@@ -79,6 +61,12 @@ class ReservationDetailForm(forms.ModelForm):
         self.helper.add_input(Button('delete', _('Delete'), onclick="deleteReservation()",
                                      css_class='btn-danger'))
 
+    def save(self, commit=True):
+        instance = super().save(commit=False)
+        if commit:
+            self.result = ReservationService(self.car).save(instance)
+        return instance
+
     def clean(self):
         start_time = self.cleaned_data['start_time']
         end_time = self.cleaned_data['end_time']
@@ -87,33 +75,25 @@ class ReservationDetailForm(forms.ModelForm):
         if start_time >= end_time:
             raise ValidationError(_("End time must come after start time"))
 
-        # Check overlap
-        if not self.car.time_slot_free(start_time, end_time, exclude_reservation_id=self.id):
-            raise ValidationError(_("Reservation overlaps with another reservation"))
-
-        # Check if we could create a new charging reservation
-        if self.car.get_distance_left(start_time, exclude_reservation_id=self.id) < self.cleaned_data['distance']:
-            charging_slot = self.car.find_charging_slot(start_time, exclude_reservation_id=self.id)
-            if charging_slot is not None:
-                charging_reservation = ChargingReservation(car=self.car,
-                                                           start_time=charging_slot,
-                                                           end_time=charging_slot + datetime.timedelta(
-                                                               hours=self.car.charging_time))
-                charging_reservation.save()
-                messages.info(
-                    self.request,
-                    _("We automatically added a charging reservation at %(charging_time)s.")
-                    % {'charging_time': charging_slot.strftime('%d %b %Y %H:%M:%S')}
-                )
+        check_recurrence(self.cleaned_data.get('recurrence'), start_time, end_time)
+
+
+def check_recurrence(recurrence, start_time, end_time):
+    if not recurrence or not start_time or not end_time:
+        return
+    try:
+        validate_recurrence(recurrence)
+        validate_occurrence_count(recurrence, start_time)
+    except ValidationError:
+        return  # reported on the field when the model is validated
+    if occurrences_overlap(expand(recurrence, start_time, end_time)):
+        raise ValidationError(_("The occurrences of this reservation overlap each other"))
 
 
 class ChargingReservationAddForm(forms.ModelForm):
     class Meta:
         model = ChargingReservation
         fields = ('start_time', 'end_time')
-        widgets = {
-            'end_time': forms.TextInput(attrs={'readonly': True})
-        }
 
     def __init__(self, *args, **kwargs):
         self.car = kwargs.pop('car')
@@ -138,24 +118,13 @@ class ChargingReservationAddForm(forms.ModelForm):
         if start_time >= end_time:
             raise ValidationError(_("End time must come after start time"))
 
-        # Check overlap
-        if not self.car.time_slot_free(start_time, end_time):
-            raise ValidationError(_("Reservation overlaps with another reservation"))
-
-        # Check charging time
-        charging_time = self.cleaned_data['end_time'] - self.cleaned_data['start_time']
-        if charging_time.total_seconds() < self.car.charging_time * 60 * 60:
-            raise ValidationError(_("The car should charge for at least %(charging_time)s hours") %
-                                  {'charging_time': self.car.charging_time})
+        # A charge shorter than the charging time is a top-up, which restores part of the driving range
 
 
 class ChargingReservationDetailForm(forms.ModelForm):
     class Meta:
         model = ChargingReservation
         fields = ('start_time', 'end_time')
-        widgets = {
-            'end_time': forms.TextInput(attrs={'readonly': True})
-        }
 
     def __init__(self, *args, **kwargs):
         self.car = kwargs.pop('car')
@@ -176,15 +145,7 @@ class ChargingReservationDetailForm(forms.ModelForm):
         if start_time >= end_time:
             raise ValidationError(_("End time must come after start time"))
 
-        # Check overlap
-        if not self.car.time_slot_free(start_time, end_time, exclude_charging_reservation_id=self.id):
-            raise ValidationError(_("Reservation overlaps with another reservation"))
-
-        # Check charging time
-        charging_time = self.cleaned_data['end_time'] - self.cleaned_data['start_time']
-        if charging_time.total_seconds() < self.car.charging_time * 60 * 60:
-            raise ValidationError(_("The car should charge for at least %(charging_time)s hours") %
-                                  {'charging_time': self.car.charging_time})
+        # A charge shorter than the charging time is a top-up, which restores part of the driving range
 
 
 class UserConfigForm(forms.Form):
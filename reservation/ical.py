@@ -0,0 +1,99 @@
+import datetime
+
+from django.core import signing
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+from reservation.serializers import capitalize_first_letter
+
+CHUNK_SIZE = 500
+
+
+def get_feed_signer(car_id):
+    return signing.Signer(salt=f'reservation.feed.{car_id}')
+
+
+def get_feed_token(user, car):
+    return get_feed_signer(car.id).sign(str(user.id))
+
+
+def get_feed_user_id(car_id, token):
+    try:
+        return int(get_feed_signer(car_id).unsign(token))
+    except (signing.BadSignature, ValueError):
+        return None
+
+
+def escape_text(text):
+    return text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\r\n', '\\n') \
+        .replace('\n', '\\n')
+
+
+def fold_line(line):
+    """Split a content line in lines of at most 75 octets, continued with a leading space."""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + '\r\n'
+
+    lines = []
+    start = 0
+    limit = 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Never split a multi-byte character
+        while end < len(encoded) and encoded[end] & 0xC0 == 0x80:
+            end -= 1
+        lines.append(encoded[start:end].decode())
+        start = end
+        limit = 74
+    return '\r\n '.join(lines) + '\r\n'
+
+
+def format_datetime(value):
+    return value.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def format_event(uid, start_time, end_time, summary, description='', timestamp=''):
+    lines = [
+        'BEGIN:VEVENT',
+        f'UID:{uid}',
+        f'DTSTAMP:{timestamp}',
+        f'DTSTART:{format_datetime(start_time)}',
+        f'DTEND:{format_datetime(end_time)}',
+        f'SUMMARY:{escape_text(summary)}',
+    ]
+    if description:
+        lines.append(f'DESCRIPTION:{escape_text(description)}')
+    lines.append('END:VEVENT')
+    return ''.join(fold_line(line) for line in lines)
+
+
+def iter_calendar(car, host):
+    """Yield the car's bookings as an iCalendar file, a chunk of rows at a time."""
+    timestamp = format_datetime(timezone.now())
+    yield ''.join(fold_line(line) for line in [
+        'BEGIN:VCALENDAR',
+        'VERSION:2.0',
+        'PRODID:-//Electric Reservation//NL',
+        'CALSCALE:GREGORIAN',
+        f'X-WR-CALNAME:{escape_text(car.name)}',
+    ])
+
+    reservations = car.reservation_set.select_related('owner').order_by('start_time')
+    for reservation in reservations.iterator(chunk_size=CHUNK_SIZE):
+        summary = f"{capitalize_first_letter(reservation.owner.username)} · " \
+            f"{capitalize_first_letter(reservation.location)} · {reservation.distance} km"
+        for index, (start_time, end_time) in enumerate(reservation.get_occurrences()):
+            # Every occurrence is a separate event, so calendar apps need no RRULE support
+            uid = f'reservation-{reservation.id}-{index}@{host}' if index else f'reservation-{reservation.id}@{host}'
+            yield format_event(uid, start_time, end_time, summary, reservation.description, timestamp)
+
+    # Translators: Charging reservation title
+    charging_title = _("Charging")
+    charging_reservations = car.chargingreservation_set.order_by('start_time')
+    for charging_reservation in charging_reservations.iterator(chunk_size=CHUNK_SIZE):
+        yield format_event(f'charging-reservation-{charging_reservation.id}@{host}',
+                           charging_reservation.start_time, charging_reservation.end_time, charging_title,
+                           timestamp=timestamp)
+
+    yield 'END:VCALENDAR\r\n'
@@ -0,0 +1,40 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from reservation.benchmarks import run_benchmarks
+
+
+class Command(BaseCommand):
+    help = "Measure the query count and wall time of the hot paths of the reservation app on a dense calendar"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--samples', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the results to this JSON file")
+        parser.add_argument('--compare', help="Show the change against the results in this JSON file")
+
+    def handle(self, *args, **options):
+        results = run_benchmarks(days=options['days'], samples=options['samples'], seed=options['seed'])
+
+        previous_results = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                previous_results = json.load(f)['results']
+
+        for name, result in results.items():
+            line = f"{name:28} {result['queries']:5} queries {result['median_ms']:10.2f} ms median"
+            previous = previous_results.get(name)
+            if previous:
+                query_change = result['queries'] - previous['queries']
+                time_change = (result['median_ms'] / previous['median_ms'] - 1) * 100 if previous['median_ms'] else 0
+                line += f"   ({query_change:+d} queries, {time_change:+.1f}% time)"
+            self.stdout.write(line)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'parameters': {'days': options['days'], 'samples': options['samples'], 'seed': options['seed']},
+                    'results': results,
+                }, f, indent=2, sort_keys=True)
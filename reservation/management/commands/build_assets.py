@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from reservation.assets import brotli, build_bundles
+
+
+class Command(BaseCommand):
+    help = "Build the minified, hashed and compressed asset bundles in STATIC_ROOT, run it after collectstatic"
+
+    def handle(self, *args, **options):
+        for name, path in build_bundles().items():
+            self.stdout.write(f"{name}: {path}")
+        if brotli is None:
+            self.stderr.write("Install brotli to build the .br variants as well")
@@ -0,0 +1,29 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from reservation.bulk import FORMATS, iter_export
+from reservation.models import Car
+
+
+class Command(BaseCommand):
+    help = "Export the reservations of a car as CSV or JSON, in the format import_reservations reads"
+
+    def add_arguments(self, parser):
+        parser.add_argument('car_id', type=int)
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--output', help="Write to this file instead of standard output")
+
+    def handle(self, *args, **options):
+        try:
+            car = Car.objects.get(pk=options['car_id'])
+        except Car.DoesNotExist as e:
+            raise CommandError(e)
+
+        f = open(options['output'], 'w', encoding='utf-8', newline='') if options['output'] else sys.stdout
+        try:
+            for chunk in iter_export(car, options['format']):
+                f.write(chunk)
+        finally:
+            if options['output']:
+                f.close()
@@ -0,0 +1,40 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from reservation.bulk import FORMATS, BulkFormatError, import_reservations, parse_rows
+from reservation.models import Car
+
+
+class Command(BaseCommand):
+    help = "Import reservations for a car from a CSV or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument('car_id', type=int)
+        parser.add_argument('username', help="The owner of the imported reservations")
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help="Defaults to the extension of the file")
+        parser.add_argument('--dry-run', action='store_true', help="Only validate the reservations")
+
+    def handle(self, *args, **options):
+        try:
+            car = Car.objects.get(pk=options['car_id'])
+            owner = User.objects.get(username=options['username'])
+        except (Car.DoesNotExist, User.DoesNotExist) as e:
+            raise CommandError(e)
+
+        content_format = options['format'] or os.path.splitext(options['path'])[1].lstrip('.').lower()
+        with open(options['path'], encoding='utf-8') as f:
+            try:
+                rows = parse_rows(f.read(), content_format)
+            except BulkFormatError as e:
+                raise CommandError(e)
+
+        report = import_reservations(car, owner, rows, dry_run=options['dry_run'])
+        for entry in report:
+            messages = [f"{field}: {error}" for field, errors in entry.get('errors', {}).items() for error in errors]
+            messages += entry.get('warnings', [])
+            self.stdout.write(f"Row {entry['row']}: {entry['status']} {'; '.join(messages)}".rstrip())
+        created = sum(entry['status'] == 'created' for entry in report)
+        self.stdout.write(f"{created} of {len(report)} reservations created")
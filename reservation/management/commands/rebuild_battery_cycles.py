@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from reservation.models import Car, BatteryCycle
+
+
+class Command(BaseCommand):
+    help = "Rebuild the battery cycles of every car from its charging reservations and reservations"
+
+    def handle(self, *args, **options):
+        for car in Car.objects.all():
+            with transaction.atomic():
+                BatteryCycle.rebuild(car)
+            self.stdout.write(f"{car}: {car.batterycycle_set.count()} battery cycles")
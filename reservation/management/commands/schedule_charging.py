@@ -0,0 +1,46 @@
+import datetime
+
+import dateutil.parser
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from reservation.bulk import format_time
+from reservation.models import Car
+from reservation.scheduler import schedule_charging
+
+
+class Command(BaseCommand):
+    help = "Replace the charging reservations of a car in a horizon with the fewest charges its reservations need"
+
+    def add_arguments(self, parser):
+        parser.add_argument('car_id', type=int)
+        parser.add_argument('--start', help="Start of the horizon, defaults to now")
+        parser.add_argument('--days', type=int, default=14, help="Length of the horizon")
+        parser.add_argument('--dry-run', action='store_true', help="Only show the changes")
+
+    def handle(self, *args, **options):
+        try:
+            car = Car.objects.get(pk=options['car_id'])
+        except Car.DoesNotExist as e:
+            raise CommandError(e)
+
+        start_time = timezone.now()
+        if options['start']:
+            start_time = dateutil.parser.parse(options['start'])
+            if timezone.is_naive(start_time):
+                start_time = timezone.make_aware(start_time)
+        end_time = start_time + datetime.timedelta(days=options['days'])
+
+        schedule = schedule_charging(car, start_time, end_time, dry_run=options['dry_run'])
+        changes = [(c.start_time, c.end_time, f"  {format_time(c.start_time)} - {format_time(c.end_time)} #{c.id}")
+                   for c in schedule.keep]
+        changes += [(start, end, f"+ {format_time(start)} - {format_time(end)}") for start, end in schedule.add]
+        changes += [(c.start_time, c.end_time, f"- {format_time(c.start_time)} - {format_time(c.end_time)} #{c.id}")
+                    for c in schedule.remove]
+        for _, _, line in sorted(changes):
+            self.stdout.write(line)
+        for entry in schedule.unmet:
+            self.stdout.write(f"! Reservation #{entry.reservation_id} at {format_time(entry.start_time)}: "
+                              f"{entry.reason.replace('_', ' ')}")
+        self.stdout.write(f"{len(schedule.add)} charges added, {len(schedule.remove)} removed, "
+                          f"{len(schedule.keep)} kept" + (" (dry run)" if options['dry_run'] else ""))
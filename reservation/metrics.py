@@ -0,0 +1,132 @@
+import collections
+import functools
+import random
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+# Upper bounds in milliseconds of the buckets of the response time histogram
+HISTOGRAM_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+Sample = collections.namedtuple('Sample', ['total', 'db', 'serializer', 'view', 'queries'])
+
+_local = threading.local()
+_samples = {}
+_samples_lock = threading.Lock()
+
+
+class Recorder:
+    """Collects the SQL and serializer time of the request running on this thread."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db = 0.0
+        self.serializer = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - start
+            self.queries += 1
+
+
+def timed_serializer(function):
+    """Count the time spent in the decorated function, minus its SQL time, as serializer time."""
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        recorder = getattr(_local, 'recorder', None)
+        if recorder is None:
+            return function(*args, **kwargs)
+
+        start, db_start = time.perf_counter(), recorder.db
+        try:
+            return function(*args, **kwargs)
+        finally:
+            recorder.serializer += (time.perf_counter() - start) - (recorder.db - db_start)
+    return wrapper
+
+
+def record_sample(name, sample):
+    with _samples_lock:
+        if name not in _samples:
+            _samples[name] = collections.deque(maxlen=getattr(settings, 'REQUEST_METRICS_WINDOW', 500))
+        _samples[name].append(sample)
+
+
+def clear_samples():
+    with _samples_lock:
+        _samples.clear()
+
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summarize(samples):
+    summary = {'count': len(samples)}
+    for field in Sample._fields:
+        values = sorted(getattr(sample, field) for sample in samples)
+        summary[field] = {
+            'mean': round(statistics.mean(values), 3),
+            'p50': round(percentile(values, 0.5), 3),
+            'p95': round(percentile(values, 0.95), 3),
+            'max': round(values[-1], 3),
+        }
+
+    buckets = collections.OrderedDict((bound, 0) for bound in HISTOGRAM_BUCKETS)
+    for sample in samples:
+        buckets[next(bound for bound in HISTOGRAM_BUCKETS if sample.total <= bound)] += 1
+    summary['histogram'] = [{'le': 'inf' if bound == float('inf') else bound, 'count': count}
+                            for bound, count in buckets.items()]
+    return summary
+
+
+def get_metrics():
+    with _samples_lock:
+        samples = {name: list(name_samples) for name, name_samples in _samples.items()}
+    return {name: summarize(name_samples) for name, name_samples in sorted(samples.items())}
+
+
+class RequestMetricsMiddleware:
+    """
+    Measure a sample of the requests to the reservation app.
+
+    A measured request gets a Server-Timing header and is added to a rolling window per URL name, which only lives
+    in the memory of this process. REQUEST_METRICS_SAMPLE_RATE sets the fraction of the requests that is measured.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= getattr(settings, 'REQUEST_METRICS_SAMPLE_RATE', 1.0):
+            return self.get_response(request)
+
+        recorder = _local.recorder = Recorder()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        finally:
+            del _local.recorder
+        total = time.perf_counter() - start
+
+        match = request.resolver_match
+        if match is None or match.namespace != 'reservation':
+            return response
+
+        sample = Sample(total=total * 1000, db=recorder.db * 1000, serializer=recorder.serializer * 1000,
+                        view=(total - recorder.db - recorder.serializer) * 1000, queries=recorder.queries)
+        record_sample(match.url_name, sample)
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={sample.db:.2f};desc="{sample.queries} queries"',
+            f'serializer;dur={sample.serializer:.2f}',
+            f'view;dur={sample.view:.2f}',
+            f'total;dur={sample.total:.2f}',
+        ])
+        return response
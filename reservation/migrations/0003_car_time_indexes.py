@@ -0,0 +1,36 @@
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0002_auto_20190603_1444'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='chargingreservation',
+            name='reservation_start_t_0128c3_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='chargingreservation',
+            name='reservation_end_tim_f12d76_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='reservation',
+            name='reservation_start_t_616378_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='reservation',
+            name='reservation_end_tim_9da8ac_idx',
+        ),
+        migrations.AddIndex(
+            model_name='chargingreservation',
+            index=models.Index(fields=['car', 'start_time', 'end_time'], name='reservation_car_id_e7e423_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['car', 'start_time', 'end_time'], name='reservation_car_id_10ea50_idx'),
+        ),
+    ]
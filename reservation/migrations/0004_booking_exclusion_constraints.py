@@ -0,0 +1,33 @@
+
+from django.db import migrations
+
+TABLES = ('reservation_reservation', 'reservation_chargingreservation')
+
+
+def add_exclusion_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    for table in TABLES:
+        schema_editor.execute(
+            f'ALTER TABLE {table} ADD CONSTRAINT {table}_no_overlap '
+            f'EXCLUDE USING gist (car_id WITH =, tstzrange(start_time, end_time) WITH &&)'
+        )
+
+
+def remove_exclusion_constraints(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in TABLES:
+        schema_editor.execute(f'ALTER TABLE {table} DROP CONSTRAINT {table}_no_overlap')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0003_car_time_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_exclusion_constraints, remove_exclusion_constraints),
+    ]
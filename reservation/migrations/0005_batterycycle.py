@@ -0,0 +1,82 @@
+import bisect
+import datetime
+
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F, DurationField
+import django.db.models.deletion
+
+
+# A frozen copy of reservation.battery.get_battery_cycles, as it was when this migration was written
+def get_battery_cycles(charges, reservations):
+    unique_charges = []
+    for charge in sorted(charges, key=lambda charge: charge[1]):
+        if not unique_charges or charge[1] != unique_charges[-1][1]:
+            unique_charges.append(charge)
+    charges = unique_charges
+    cycle_starts = [charge[1] for charge in charges]
+    distances = [0] * len(charges)
+    last_ends = [None] * len(charges)
+
+    for start_time, end_time, distance in reservations:
+        index = bisect.bisect_right(cycle_starts, start_time) - 1
+        if index < 0:
+            continue
+        if index + 1 < len(cycle_starts) and end_time > cycle_starts[index + 1]:
+            continue
+        distances[index] += distance
+        if last_ends[index] is None or end_time > last_ends[index]:
+            last_ends[index] = end_time
+
+    cycles = []
+    for index, (charging_reservation_id, start_time) in enumerate(charges):
+        end_time = cycle_starts[index + 1] if index + 1 < len(cycle_starts) else None
+        cycles.append((charging_reservation_id, start_time, end_time, distances[index], last_ends[index]))
+    return cycles
+
+
+def build_battery_cycles(apps, schema_editor):
+    Car = apps.get_model('reservation', 'Car')
+    BatteryCycle = apps.get_model('reservation', 'BatteryCycle')
+    ChargingReservation = apps.get_model('reservation', 'ChargingReservation')
+    Reservation = apps.get_model('reservation', 'Reservation')
+
+    for car in Car.objects.all():
+        charges = ChargingReservation.objects.filter(car=car) \
+            .annotate(diff=ExpressionWrapper(F('end_time') - F('start_time'), output_field=DurationField())) \
+            .filter(diff__gte=datetime.timedelta(hours=car.charging_time)) \
+            .values_list('id', 'end_time')
+        reservations = Reservation.objects.filter(car=car).values_list('start_time', 'end_time', 'distance')
+        BatteryCycle.objects.bulk_create(
+            BatteryCycle(car=car, charging_reservation_id=charging_reservation_id, start_time=start_time,
+                         end_time=end_time, distance_driven=distance_driven,
+                         last_reservation_end_time=last_reservation_end_time)
+            for charging_reservation_id, start_time, end_time, distance_driven, last_reservation_end_time
+            in get_battery_cycles(charges, reservations)
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0004_booking_exclusion_constraints'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatteryCycle',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_time', models.DateTimeField(verbose_name='Starttijd')),
+                ('end_time', models.DateTimeField(blank=True, null=True, verbose_name='Eindtijd')),
+                ('distance_driven', models.PositiveIntegerField(default=0, verbose_name='Afgelegde afstand')),
+                ('last_reservation_end_time', models.DateTimeField(blank=True, null=True)),
+                ('car', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='reservation.Car')),
+                ('charging_reservation', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, to='reservation.ChargingReservation')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='batterycycle',
+            index=models.Index(fields=['car', 'start_time'], name='reservation_car_id_44d48b_idx'),
+        ),
+        migrations.RunPython(build_battery_cycles, migrations.RunPython.noop),
+    ]
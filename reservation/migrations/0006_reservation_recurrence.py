@@ -0,0 +1,27 @@
+
+from django.db import migrations, models
+import reservation.recurrence
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0005_batterycycle'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reservation',
+            name='recurrence',
+            field=models.CharField(blank=True, default='', help_text='Een iCalendar RRULE, bijvoorbeeld FREQ=WEEKLY;BYDAY=MO,FR;COUNT=10', max_length=200, validators=[reservation.recurrence.validate_recurrence], verbose_name='Herhaling'),
+        ),
+        migrations.AddField(
+            model_name='reservation',
+            name='recurrence_end_time',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='reservation',
+            index=models.Index(fields=['car', 'recurrence_end_time'], name='reservation_car_id_01d144_idx'),
+        ),
+    ]
@@ -0,0 +1,116 @@
+import bisect
+import datetime
+import itertools
+
+from dateutil import rrule
+from django.db import migrations
+from django.utils import timezone
+
+# Frozen copies of the code in reservation.battery and reservation.recurrence, as it was when this migration was
+# written. 0008_rebuild_battery_cycles_seasons uses them as well.
+
+
+def iter_occurrences(start_time, end_time, rule):
+    yield start_time, end_time
+    if not rule:
+        return
+    duration = end_time - start_time
+    dtstart = timezone.localtime(start_time).replace(tzinfo=None)
+    for local_start_time in rrule.rrulestr(rule, dtstart=dtstart, ignoretz=True):
+        occurrence_start_time = timezone.make_aware(local_start_time)
+        if occurrence_start_time > start_time:
+            yield occurrence_start_time, occurrence_start_time + duration
+
+
+def get_distances_driven(changes):
+    sums = list(itertools.accumulate(changes))
+    return [total - min(lowest, 0) for total, lowest in zip(sums, itertools.accumulate(sums, min))]
+
+
+def get_battery_cycles(charges, reservations, partial_charges):
+    unique_charges = []
+    for charge in sorted(charges, key=lambda charge: charge[1]):
+        if not unique_charges or charge[1] != unique_charges[-1][1]:
+            unique_charges.append(charge)
+    charges = unique_charges
+    cycle_starts = [charge[1] for charge in charges]
+
+    cycle_changes = [[] for _ in cycle_starts]
+    for start_time, end_time, distance in reservations:
+        index = bisect.bisect_right(cycle_starts, start_time) - 1
+        if index < 0:
+            continue
+        if index + 1 < len(cycle_starts) and end_time > cycle_starts[index + 1]:
+            continue
+        cycle_changes[index].append((end_time, distance))
+    for end_time, charged_distance in partial_charges:
+        index = bisect.bisect_right(cycle_starts, end_time) - 1
+        if index >= 0:
+            cycle_changes[index].append((end_time, -charged_distance))
+
+    cycles = []
+    for index, ((charging_reservation_id, start_time), changes) in enumerate(zip(charges, cycle_changes)):
+        changes.sort()
+        end_time = cycle_starts[index + 1] if index + 1 < len(cycle_starts) else None
+        distance_driven = get_distances_driven([change for _, change in changes])[-1] if changes else 0
+        last_change_time = max(time for time, _ in changes) if changes else None
+        cycles.append((charging_reservation_id, start_time, end_time, distance_driven, last_change_time))
+    return cycles
+
+
+def get_month_driving_range(car, time):
+    if 4 <= time.month <= 9:
+        return car.summer_driving_range
+    return car.winter_driving_range
+
+
+def rebuild_cars(apps, get_driving_range, only_with_partial_charges=False):
+    Car = apps.get_model('reservation', 'Car')
+    BatteryCycle = apps.get_model('reservation', 'BatteryCycle')
+    ChargingReservation = apps.get_model('reservation', 'ChargingReservation')
+    Reservation = apps.get_model('reservation', 'Reservation')
+
+    for car in Car.objects.all():
+        charging_duration = datetime.timedelta(hours=car.charging_time)
+        full_charges = []
+        partial_charges = []
+        for charging_reservation_id, start_time, end_time in ChargingReservation.objects.filter(car=car) \
+                .values_list('id', 'start_time', 'end_time'):
+            if end_time - start_time >= charging_duration:
+                full_charges.append((charging_reservation_id, end_time))
+            else:
+                driving_range = get_driving_range(car, end_time)
+                partial_charges.append((end_time, int(driving_range * (end_time - start_time).total_seconds()) //
+                                        int(charging_duration.total_seconds())))
+        if only_with_partial_charges and not partial_charges:
+            continue
+        reservations = [(occurrence_start_time, occurrence_end_time, distance)
+                        for start_time, end_time, recurrence, distance
+                        in Reservation.objects.filter(car=car)
+                        .values_list('start_time', 'end_time', 'recurrence', 'distance')
+                        for occurrence_start_time, occurrence_end_time
+                        in iter_occurrences(start_time, end_time, recurrence)]
+
+        BatteryCycle.objects.filter(car=car).delete()
+        BatteryCycle.objects.bulk_create(
+            BatteryCycle(car=car, charging_reservation_id=charging_reservation_id, start_time=start_time,
+                         end_time=end_time, distance_driven=distance_driven,
+                         last_reservation_end_time=last_reservation_end_time)
+            for charging_reservation_id, start_time, end_time, distance_driven, last_reservation_end_time
+            in get_battery_cycles(full_charges, reservations, partial_charges)
+        )
+
+
+def rebuild_battery_cycles(apps, schema_editor):
+    rebuild_cars(apps, get_month_driving_range)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0006_reservation_recurrence'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_battery_cycles, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,63 @@
+import bisect
+import datetime
+import importlib
+
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+# Only the distance a partial charge restores depends on the driving range, so only the cars with partial charges
+# are rebuilt, with the frozen code of the previous migration
+rebuild_cars = importlib.import_module('reservation.migrations.0007_rebuild_battery_cycles_partial_charges') \
+    .rebuild_cars
+
+# A frozen copy of the curve of reservation.seasons, as it was when this migration was written
+REFERENCE_YEAR = 2000
+DAYS_IN_YEAR = 366
+TRANSITION_DAYS = 30
+
+
+def get_date_index(month, day):
+    return datetime.date(REFERENCE_YEAR, month, day).timetuple().tm_yday - 1
+
+
+def get_summer_fractions(temperatures):
+    if not temperatures:
+        spring = get_date_index(4, 1) - TRANSITION_DAYS / 2
+        autumn = get_date_index(10, 1) - TRANSITION_DAYS / 2
+        return [min(max((day - spring) / TRANSITION_DAYS, 0), 1) - min(max((day - autumn) / TRANSITION_DAYS, 0), 1)
+                for day in range(DAYS_IN_YEAR)]
+
+    days = [get_date_index(month, 15) for month in range(1, 13)]
+    days = [days[-1] - DAYS_IN_YEAR] + days + [days[0] + DAYS_IN_YEAR]
+    temperatures = [temperatures[-1]] + list(temperatures) + [temperatures[0]]
+    coldest, warmest = min(temperatures), max(temperatures)
+    fractions = []
+    for day in range(DAYS_IN_YEAR):
+        index = bisect.bisect_right(days, day)
+        temperature = temperatures[index - 1] + (temperatures[index] - temperatures[index - 1]) * \
+            (day - days[index - 1]) / (days[index] - days[index - 1])
+        fractions.append((temperature - coldest) / (warmest - coldest) if warmest > coldest else 1)
+    return fractions
+
+
+def rebuild_battery_cycles(apps, schema_editor):
+    fractions = get_summer_fractions(getattr(settings, 'DRIVING_RANGE_TEMPERATURES', None))
+
+    def get_driving_range(car, time):
+        day_index = timezone.localtime(time).date().replace(year=REFERENCE_YEAR).timetuple().tm_yday - 1
+        return round(car.winter_driving_range +
+                     (car.summer_driving_range - car.winter_driving_range) * fractions[day_index])
+
+    rebuild_cars(apps, get_driving_range, only_with_partial_charges=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reservation', '0007_rebuild_battery_cycles_partial_charges'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_battery_cycles, migrations.RunPython.noop),
+    ]
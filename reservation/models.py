@@ -1,14 +1,110 @@
+import copy
 import datetime
 
 import dateutil
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
-from django.db import models
-from django.db.models import ExpressionWrapper, F, DurationField, Sum, Q
-from django.db.models.signals import post_save
+from django.db import models, connection, transaction, IntegrityError
+from django.db.models import ExpressionWrapper, F, DurationField, Q, Value, CharField, IntegerField
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.utils.translation import gettext as _
 
+from reservation.battery import get_battery_cycles, get_distances_driven
+from reservation.cache import bump_car_generation, delete_user_car_ids
+from reservation.recurrence import expand, expand_rows, get_series_end_time, intervals_overlap, occurrences_overlap, \
+    validate_occurrence_count, validate_recurrence
+from reservation.seasons import get_day_index, get_range_curve, get_temperatures
+
+
+def overlapping(start_time, end_time):
+    return Q(start_time__lt=end_time) & Q(end_time__gt=start_time)
+
+
+def occurring(start_time, end_time):
+    """Select the reservations with an occurrence between start_time and end_time, recurring ones included."""
+    return overlapping(start_time, end_time) | Q(recurrence_end_time__gt=start_time, start_time__lt=end_time)
+
+
+def expand_reservations(reservations, start_time=None, end_time=None):
+    """Return the reservations with a recurring one replaced by its occurrences in the window.
+
+    The first occurrence is the reservation itself, the later ones are unsaved copies with other times.
+    """
+    occurrences = []
+    for reservation in reservations:
+        for occurrence_start_time, occurrence_end_time in reservation.get_occurrences(start_time, end_time):
+            if occurrence_start_time == reservation.start_time:
+                occurrences.append(reservation)
+                continue
+            occurrence = copy.copy(reservation)
+            occurrence.start_time = occurrence_start_time
+            occurrence.end_time = occurrence_end_time
+            occurrences.append(occurrence)
+    return occurrences
+
+
+def lock_car(car_id):
+    if connection.features.has_select_for_update:
+        list(Car.objects.select_for_update().filter(pk=car_id).values_list('pk'))
+    else:
+        # SQLite has no row locks, but a write takes the database lock until the end of the transaction
+        Car.objects.filter(pk=car_id).update(name=F('name'))
+
+
+class OverlapError(IntegrityError):
+    pass
+
+
+class Booking:
+    # Name of the PostgreSQL exclusion constraint that keeps bookings in the same table from overlapping
+    overlap_constraint = None
+
+    def save(self, *args, **kwargs):
+        try:
+            with transaction.atomic():
+                lock_car(self.car_id)
+                if self.overlaps_other_bookings():
+                    raise OverlapError(f"{self} overlaps with another reservation")
+                super().save(*args, **kwargs)
+        except OverlapError:
+            raise
+        except IntegrityError as error:
+            if getattr(getattr(error.__cause__, 'diag', None), 'constraint_name', None) == self.overlap_constraint:
+                raise OverlapError(f"{self} overlaps with another reservation") from error
+            raise
+
+    def overlaps_other_bookings(self):
+        occurrences = self.get_occurrences()
+        if occurrences_overlap(occurrences):
+            return True
+
+        start_time, end_time = occurrences[0][0], occurrences[-1][1]
+        # The exclusion constraint checks a single row on insert, but not the occurrences of a series
+        constrained = connection.vendor == 'postgresql' and len(occurrences) == 1
+        for model in (Reservation, ChargingReservation):
+            queryset = model.objects.filter(car_id=self.car_id)
+            if model is type(self) and self.pk is not None:
+                queryset = queryset.exclude(pk=self.pk)
+            if model is Reservation:
+                if model is type(self) and constrained:
+                    queryset = queryset.filter(recurrence_end_time__gt=start_time, start_time__lt=end_time)
+                else:
+                    queryset = queryset.filter(occurring(start_time, end_time))
+                intervals = expand_rows(queryset.values_list('start_time', 'end_time', 'recurrence'),
+                                        start_time, end_time)
+            elif model is type(self) and constrained:
+                continue
+            else:
+                intervals = queryset.filter(overlapping(start_time, end_time)).values_list('start_time', 'end_time')
+            if intervals_overlap(occurrences, intervals):
+                return True
+        return False
+
+    def get_occurrences(self, start_time=None, end_time=None):
+        return ((self.start_time, self.end_time),)
+
 
 class Car(models.Model):
     name = models.CharField(_("Name"), max_length=200)
@@ -28,10 +124,10 @@ class Car(models.Model):
         if exclude_reservation_id is not None:
             reservation_queryset = reservation_queryset.exclude(pk=exclude_reservation_id)
 
-        overlaps_reservation = reservation_queryset \
-            .filter(Q(start_time__lt=end_time) & Q(end_time__gt=start_time)) \
-            .exists()
-        if overlaps_reservation:
+        reservations = reservation_queryset \
+            .filter(occurring(start_time, end_time)) \
+            .values_list('start_time', 'end_time', 'recurrence')
+        if intervals_overlap([(start_time, end_time)], expand_rows(reservations, start_time, end_time)):
             return False
 
         charging_reservation_queryset = self.chargingreservation_set
@@ -39,36 +135,46 @@ class Car(models.Model):
             charging_reservation_queryset = charging_reservation_queryset.exclude(pk=exclude_charging_reservation_id)
 
         overlaps_charging_reservation = charging_reservation_queryset \
-            .filter(Q(start_time__lt=end_time) & Q(end_time__gt=start_time)) \
+            .filter(overlapping(start_time, end_time)) \
             .exists()
         if overlaps_charging_reservation:
             return False
 
         return True
 
+    def get_range_curve(self):
+        return get_range_curve(self.summer_driving_range, self.winter_driving_range, get_temperatures())
+
     def get_driving_range(self, time):
-        if 4 <= time.month <= 9:
-            return self.summer_driving_range
-        else:
-            return self.winter_driving_range
+        return self.get_range_curve()[get_day_index(time)]
 
-    def get_last_charging_time_before(self, time):
-        last_charging_reservation = self.chargingreservation_set \
+    def is_full_charge(self, start_time, end_time):
+        return end_time - start_time >= datetime.timedelta(hours=self.charging_time)
+
+    def get_charged_distance(self, start_time, end_time):
+        """The distance a charge between start_time and end_time restores, in proportion to how long it takes."""
+        driving_range = self.get_driving_range(end_time)
+        return min(driving_range, int(driving_range * (end_time - start_time).total_seconds()) //
+                   (self.charging_time * 60 * 60))
+
+    def get_full_charging_reservations(self):
+        return self.chargingreservation_set \
             .annotate(diff=ExpressionWrapper(F('end_time') - F('start_time'), output_field=DurationField())) \
-            .filter(diff__gte=datetime.timedelta(hours=self.charging_time)) \
-            .filter(end_time__lte=time) \
-            .order_by('-end_time') \
-            .first()
-        if last_charging_reservation is None:
+            .filter(diff__gte=datetime.timedelta(hours=self.charging_time))
+
+    def get_last_battery_cycle_before(self, time):
+        return self.batterycycle_set.filter(start_time__lte=time).order_by('-start_time').first()
+
+    def get_last_charging_time_before(self, time):
+        last_battery_cycle = self.get_last_battery_cycle_before(time)
+        if last_battery_cycle is None:
             last_charging_time = dateutil.parser.parse("1970-01-01T00:00+00:00")
         else:
-            last_charging_time = last_charging_reservation.end_time
+            last_charging_time = last_battery_cycle.start_time
         return last_charging_time
 
     def get_next_charging_time_after(self, time):
-        last_charging_reservation = self.chargingreservation_set \
-            .annotate(diff=ExpressionWrapper(F('end_time') - F('start_time'), output_field=DurationField())) \
-            .filter(diff__gte=datetime.timedelta(hours=self.charging_time)) \
+        last_charging_reservation = self.get_full_charging_reservations() \
             .filter(start_time__gte=time) \
             .order_by('start_time') \
             .first()
@@ -78,17 +184,38 @@ class Car(models.Model):
             last_charging_time = last_charging_reservation.end_time
         return last_charging_time
 
-    def get_distance_left(self, time, exclude_reservation_id=None):
-        last_charging_time = self.get_last_charging_time_before(time)
+    def get_distance_left(self, time, exclude_reservation_id=None, last_charging_time=None):
+        if last_charging_time is None and exclude_reservation_id is None:
+            last_battery_cycle = self.get_last_battery_cycle_before(time)
+            if last_battery_cycle is not None and last_battery_cycle.has_ended_reservations_before(time):
+                return self.get_driving_range(time) - last_battery_cycle.distance_driven
+
+        if last_charging_time is None:
+            last_charging_time = self.get_last_charging_time_before(time)
         queryset = self.reservation_set
         if exclude_reservation_id is not None:
             queryset = queryset.exclude(pk=exclude_reservation_id)
-        distance_driven = queryset \
-            .filter(start_time__gte=last_charging_time, end_time__lte=time) \
-            .aggregate(Sum('distance'))['distance__sum']
-
-        if not distance_driven:
-            distance_driven = 0
+        # Summed here instead of in the database, as the occurrences of a series only exist after expanding it and
+        # a partial charge can't restore more than was driven
+        reservations = queryset \
+            .filter(Q(start_time__gte=last_charging_time, end_time__lte=time) |
+                    Q(recurrence_end_time__gt=last_charging_time, start_time__lt=time)) \
+            .values_list('start_time', 'end_time', 'recurrence', 'distance')
+        # The charges since the last full one are all partial, they have no distance
+        partial_charges = self.chargingreservation_set \
+            .filter(end_time__gt=last_charging_time, end_time__lte=time) \
+            .annotate(recurrence=Value('', output_field=CharField()),
+                      distance=Value(None, output_field=IntegerField())) \
+            .values_list('start_time', 'end_time', 'recurrence', 'distance')
+        changes = []
+        for start_time, end_time, distance in expand_rows(reservations.union(partial_charges, all=True),
+                                                          last_charging_time, time):
+            if distance is None:
+                changes.append((end_time, -self.get_charged_distance(start_time, end_time)))
+            elif start_time >= last_charging_time and end_time <= time:
+                changes.append((end_time, distance))
+        changes.sort()
+        distance_driven = get_distances_driven([change for _, change in changes])[-1] if changes else 0
 
         return self.get_driving_range(time) - distance_driven
 
@@ -96,7 +223,12 @@ class Car(models.Model):
         if self.get_distance_left(time) == self.get_driving_range(time):
             return None
 
-        last_charging_time = self.get_last_charging_time_before(time)
+        return self.find_charging_slot_after(self.get_last_charging_time_before(time), time, exclude_reservation_id)
+
+    def find_charging_slot_after(self, last_charging_time, time, exclude_reservation_id=None):
+        # Subtracting from a local time moves its clock time, which isn't the time that passes when daylight saving
+        # time starts or ends, so the slots are computed in UTC like the times of the bookings
+        time = time.astimezone(datetime.timezone.utc)
         min_search_time = time - datetime.timedelta(days=3)  # search max 3 days in the past
 
         # Round time down to half hour and subtract another half hour for spacing
@@ -107,16 +239,46 @@ class Car(models.Model):
         else:
             current_end_time = dt_start_of_hour
 
-        current_start_time = current_end_time - datetime.timedelta(hours=self.charging_time)
-        while current_start_time > last_charging_time and current_start_time > min_search_time:
-            if self.time_slot_free(current_start_time, current_end_time, exclude_reservation_id=exclude_reservation_id):
-                return current_start_time - datetime.timedelta(minutes=30)
-            current_start_time = current_start_time - datetime.timedelta(minutes=30)
-            current_end_time = current_end_time - datetime.timedelta(minutes=30)
+        charging_duration = datetime.timedelta(hours=self.charging_time)
+        step = datetime.timedelta(minutes=30)
+        first_start_time = current_end_time - charging_duration
+        lower_bound = max(last_charging_time, min_search_time)
+
+        # Walk back over the occupied intervals, latest end first, jumping the candidate slot (kept on the
+        # half hour grid) to just before every interval it overlaps
+        current_start_time = first_start_time
+        for interval_start, interval_end in self.get_occupied_intervals(lower_bound, current_end_time,
+                                                                        exclude_reservation_id):
+            if current_start_time <= lower_bound:
+                break
+            if interval_end <= current_start_time:
+                break
+            if interval_start >= current_start_time + charging_duration:
+                continue
+            steps_back = -((interval_start - charging_duration - first_start_time) // step)
+            current_start_time = first_start_time - steps_back * step
+
+        if current_start_time > lower_bound:
+            return current_start_time - step
         return None
 
+    def get_occupied_intervals(self, start_time, end_time, exclude_reservation_id=None):
+        reservation_queryset = self.reservation_set
+        if exclude_reservation_id is not None:
+            reservation_queryset = reservation_queryset.exclude(pk=exclude_reservation_id)
+        intervals = list(expand_rows(reservation_queryset
+                                     .filter(occurring(start_time, end_time))
+                                     .values_list('start_time', 'end_time', 'recurrence'),
+                                     start_time, end_time))
+        intervals += self.chargingreservation_set \
+            .filter(overlapping(start_time, end_time)) \
+            .values_list('start_time', 'end_time')
+        return sorted(intervals, key=lambda interval: interval[1], reverse=True)
+
+
+class Reservation(Booking, models.Model):
+    overlap_constraint = 'reservation_reservation_no_overlap'
 
-class Reservation(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE)
     car = models.ForeignKey(Car, on_delete=models.CASCADE)
     description = models.CharField(_("Description"), max_length=200, default='', blank=True)
@@ -139,19 +301,63 @@ class Reservation(models.Model):
     )
     priority = models.CharField(_("Priority"), choices=PRIORITY_CHOICES, max_length=1, default=PRIORITY_LOW, blank=True)
 
+    recurrence = models.CharField(_("Recurrence"), max_length=200, default='', blank=True,
+                                  validators=[validate_recurrence],
+                                  help_text=_("An iCalendar RRULE, for example FREQ=WEEKLY;BYDAY=MO,FR;COUNT=10"))
+    # End time of the last occurrence, only set for recurring reservations
+    recurrence_end_time = models.DateTimeField(blank=True, null=True, editable=False)
+
     def __str__(self):
         return f"Reservation {self.start_time.strftime('%Y-%m-%d %H:%M')}" \
             f"-{self.end_time.strftime('%H:%M')}" \
             f" for {self.car} by {self.owner}"
 
+    # Recurrence as loaded from the database
+    loaded_recurrence = ''
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_recurrence = instance.__dict__.get('recurrence', '')
+        return instance
+
+    def clean(self):
+        if not self.recurrence or not self.start_time:
+            return
+        try:
+            validate_recurrence(self.recurrence)
+        except ValidationError:
+            return  # reported by the validator of the field
+        try:
+            validate_occurrence_count(self.recurrence, self.start_time)
+        except ValidationError as e:
+            raise ValidationError({'recurrence': e})
+
+    def save(self, *args, **kwargs):
+        self.update_recurrence_end_time()
+        super().save(*args, **kwargs)
+
+    def update_recurrence_end_time(self):
+        if self.recurrence:
+            self.recurrence_end_time = get_series_end_time(self.recurrence, self.start_time, self.end_time)
+        else:
+            self.recurrence_end_time = None
+
+    def get_occurrences(self, start_time=None, end_time=None):
+        if not self.recurrence:
+            return super().get_occurrences(start_time, end_time)
+        return expand(self.recurrence, self.start_time, self.end_time, start_time, end_time)
+
     class Meta:
         indexes = [
-            models.Index(fields=['start_time']),
-            models.Index(fields=['end_time']),
+            models.Index(fields=['car', 'start_time', 'end_time']),
+            models.Index(fields=['car', 'recurrence_end_time']),
         ]
 
 
-class ChargingReservation(models.Model):
+class ChargingReservation(Booking, models.Model):
+    overlap_constraint = 'reservation_chargingreservation_no_overlap'
+
     car = models.ForeignKey(Car, on_delete=models.CASCADE)
     start_time = models.DateTimeField(_("Start time"))
     end_time = models.DateTimeField(_("End time"))
@@ -162,8 +368,66 @@ class ChargingReservation(models.Model):
 
     class Meta:
         indexes = [
-            models.Index(fields=['start_time']),
-            models.Index(fields=['end_time']),
+            models.Index(fields=['car', 'start_time', 'end_time']),
+        ]
+
+
+class BatteryCycle(models.Model):
+    """The time between the end of a full charge and the end of the next one, with the distance driven in it."""
+    car = models.ForeignKey(Car, on_delete=models.CASCADE)
+    charging_reservation = models.OneToOneField(ChargingReservation, on_delete=models.CASCADE)
+
+    start_time = models.DateTimeField(_("Start time"))
+    end_time = models.DateTimeField(_("End time"), blank=True, null=True)
+
+    distance_driven = models.PositiveIntegerField(_("Distance driven"), default=0)
+    last_reservation_end_time = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Battery cycle from {self.start_time.strftime('%Y-%m-%d %H:%M')} for {self.car}"
+
+    def has_ended_reservations_before(self, time):
+        return self.last_reservation_end_time is None or self.last_reservation_end_time <= time
+
+    @classmethod
+    def rebuild(cls, car, since=None):
+        """Recreate the battery cycles of a car, starting with the cycle that is running at since."""
+        cycles = cls.objects.filter(car=car)
+        anchor = None
+        if since is not None:
+            anchor = cycles.filter(start_time__lt=since).order_by('-start_time') \
+                .values_list('start_time', flat=True).first()
+        charging_reservations = car.chargingreservation_set
+        reservations = car.reservation_set
+        if anchor is not None:
+            cycles = cycles.filter(start_time__gte=anchor)
+            charging_reservations = charging_reservations.filter(end_time__gte=anchor)
+            reservations = reservations.filter(Q(start_time__gte=anchor) | Q(recurrence_end_time__gt=anchor))
+        reservations = expand_rows(reservations.values_list('start_time', 'end_time', 'recurrence', 'distance'),
+                                   anchor)
+        full_charges = []
+        partial_charges = []
+        for charging_reservation_id, start_time, end_time in charging_reservations.values_list('id', 'start_time',
+                                                                                              'end_time'):
+            if car.is_full_charge(start_time, end_time):
+                full_charges.append((charging_reservation_id, end_time))
+            else:
+                partial_charges.append((end_time, car.get_charged_distance(start_time, end_time)))
+
+        cycles.delete()
+        cls.objects.bulk_create(
+            cls(car=car, charging_reservation_id=charging_reservation_id, start_time=start_time, end_time=end_time,
+                distance_driven=distance_driven, last_reservation_end_time=last_reservation_end_time)
+            for charging_reservation_id, start_time, end_time, distance_driven, last_reservation_end_time
+            in get_battery_cycles(full_charges,
+                                  [reservation for reservation in reservations
+                                   if anchor is None or reservation[0] >= anchor],
+                                  partial_charges)
+        )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['car', 'start_time']),
         ]
 
 
@@ -185,9 +449,16 @@ class Profile(models.Model):
             return self.last_car
         else:
             new_last_car = self.user.car_set.first()
-            self.last_car = new_last_car
+            if new_last_car is not None:
+                self.set_last_car(new_last_car)
             return new_last_car
 
+    def set_last_car(self, car):
+        # Only write the column when it changes, viewing the calendar of the same car again writes nothing
+        if self.last_car_id != car.id:
+            Profile.objects.filter(pk=self.pk).update(last_car=car)
+        self.last_car = car
+
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -196,5 +467,126 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
+def save_user_profile(sender, instance, update_fields=None, **kwargs):
+    # Logging in only saves last_login, which leaves the profile and the cached feeds as they are
+    if update_fields is not None and 'username' not in update_fields:
+        return
     instance.profile.save()
+
+
+def bump_car_generation_on_commit(car_id):
+    # A reader between the bump and the commit would cache the old rows under the new generation
+    transaction.on_commit(lambda: bump_car_generation(car_id))
+
+
+def delete_user_car_ids_on_commit(user_id):
+    # A request between the delete and the commit would cache the old membership again
+    transaction.on_commit(lambda: delete_user_car_ids(user_id))
+
+
+@receiver(post_save, sender=Car)
+@receiver(post_delete, sender=Car)
+def invalidate_car_cache(sender, instance, **kwargs):
+    bump_car_generation_on_commit(instance.id)
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_save, sender=ChargingReservation)
+@receiver(post_delete, sender=ChargingReservation)
+def invalidate_reservation_car_cache(sender, instance, **kwargs):
+    bump_car_generation_on_commit(instance.car_id)
+
+
+@receiver(pre_save, sender=Reservation)
+@receiver(pre_save, sender=ChargingReservation)
+def remember_previous_times(sender, instance, **kwargs):
+    instance._previous_times = None
+    if instance.pk is not None:
+        instance._previous_times = sender.objects.filter(pk=instance.pk).values_list('start_time', 'end_time').first()
+
+
+# Cars whose reservations are being deleted along with them, which need no new battery cycles
+cars_being_deleted = set()
+
+
+@receiver(pre_delete, sender=Car)
+def remember_car_being_deleted(sender, instance, **kwargs):
+    cars_being_deleted.add(instance.id)
+
+
+@receiver(post_delete, sender=Car)
+def forget_car_being_deleted(sender, instance, **kwargs):
+    cars_being_deleted.discard(instance.id)
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_delete, sender=Reservation)
+def update_reservation_battery_cycles(sender, instance, **kwargs):
+    if instance.car_id in cars_being_deleted:
+        return
+    times = [instance.start_time]
+    if getattr(instance, '_previous_times', None):
+        times.append(instance._previous_times[0])
+    BatteryCycle.rebuild(instance.car, since=min(times))
+
+
+@receiver(post_save, sender=ChargingReservation)
+@receiver(post_delete, sender=ChargingReservation)
+def update_charging_reservation_battery_cycles(sender, instance, **kwargs):
+    if instance.car_id in cars_being_deleted:
+        return
+    times = [instance.end_time]
+    if getattr(instance, '_previous_times', None):
+        times.append(instance._previous_times[1])
+    BatteryCycle.rebuild(instance.car, since=min(times))
+
+
+@receiver(post_save, sender=Car)
+def update_car_battery_cycles(sender, instance, **kwargs):
+    # The charging time decides which charging reservations are full charges
+    BatteryCycle.rebuild(instance)
+
+
+@receiver(post_save, sender=Profile)
+def invalidate_profile_car_cache(sender, instance, update_fields=None, **kwargs):
+    # Saving a user saves its profile as well; both the username and the calendar color are in the cached feeds
+    if update_fields is None or 'calendar_color' in update_fields:
+        for car_id in instance.user.car_set.values_list('id', flat=True):
+            bump_car_generation_on_commit(car_id)
+
+
+@receiver(post_save, sender=User)
+def invalidate_new_user_car_ids(sender, instance, created, **kwargs):
+    # The id of a deleted user can be reused
+    if created:
+        delete_user_car_ids_on_commit(instance.id)
+
+
+@receiver(m2m_changed, sender=Car.users.through)
+def invalidate_user_car_ids(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        user_ids = [instance.id]
+    elif action == 'pre_clear':
+        instance._cleared_user_ids = list(instance.users.values_list('id', flat=True))
+        return
+    elif action == 'post_clear':
+        user_ids = instance._cleared_user_ids
+    else:
+        user_ids = pk_set
+
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        for user_id in user_ids:
+            delete_user_car_ids_on_commit(user_id)
+
+
+@receiver(pre_delete, sender=Car)
+def remember_car_users(sender, instance, **kwargs):
+    # Deleting a car removes its users without m2m_changed
+    instance._deleted_user_ids = list(instance.users.values_list('id', flat=True))
+
+
+@receiver(post_delete, sender=Car)
+def invalidate_car_user_car_ids(sender, instance, **kwargs):
+    for user_id in getattr(instance, '_deleted_user_ids', []):
+        delete_user_car_ids_on_commit(user_id)
@@ -0,0 +1,22 @@
+from reservation.cache import get_user_car_ids
+from reservation.models import Car
+
+
+def get_car_ids_for_user(user_id):
+    """Return the ids of the cars of a user, cached until Car.users changes."""
+    return frozenset(get_user_car_ids(user_id, lambda: list(
+        Car.objects.filter(users=user_id).values_list('id', flat=True))))
+
+
+def get_car_ids(request):
+    """Return the ids of the cars of the user of the request, resolved once per request."""
+    if not hasattr(request, '_car_ids'):
+        if request.user.is_authenticated:
+            request._car_ids = get_car_ids_for_user(request.user.id)
+        else:
+            request._car_ids = frozenset()
+    return request._car_ids
+
+
+def has_car(request, car_id):
+    return int(car_id) in get_car_ids(request)
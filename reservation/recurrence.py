@@ -0,0 +1,92 @@
+import bisect
+import functools
+
+from dateutil import rrule
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+MAX_OCCURRENCES = 500
+
+
+def parse_rule(rule, start_time):
+    # Expand in local time, so a weekly booking keeps its hour when daylight saving time starts or ends
+    dtstart = timezone.localtime(start_time).replace(tzinfo=None)
+    return rrule.rrulestr(rule, dtstart=dtstart, ignoretz=True)
+
+
+def validate_recurrence(value):
+    if not value:
+        return
+    try:
+        parse_rule(value, timezone.now())
+    except (ValueError, TypeError, AttributeError):
+        raise ValidationError(_("Recurrence is not a valid rule"))
+    if 'COUNT=' not in value.upper() and 'UNTIL=' not in value.upper():
+        raise ValidationError(_("Recurrence must end, with COUNT or UNTIL"))
+
+
+def iter_occurrence_start_times(rule, start_time):
+    # The stored start time is always the first occurrence, even when the rule itself doesn't match it
+    yield start_time
+    for local_start_time in parse_rule(rule, start_time):
+        occurrence_start_time = timezone.make_aware(local_start_time)
+        if occurrence_start_time > start_time:
+            yield occurrence_start_time
+
+
+def validate_occurrence_count(rule, start_time):
+    # How many times an UNTIL rule occurs depends on when the series starts, so this needs the real start time
+    if len(list(zip(range(MAX_OCCURRENCES + 1), iter_occurrence_start_times(rule, start_time)))) > MAX_OCCURRENCES:
+        raise ValidationError(_("Recurrence can have at most %(max)s occurrences") % {'max': MAX_OCCURRENCES})
+
+
+@functools.lru_cache(maxsize=4096)
+def expand(rule, start_time, end_time, window_start=None, window_end=None):
+    """
+    Return (start time, end time) of the occurrences of a series that overlap the window, the first one included.
+
+    The arguments identify the series and the window completely, so the result can be memoized for as long as the
+    process lives.
+    """
+    duration = end_time - start_time
+    occurrences = []
+    for occurrence_start_time in iter_occurrence_start_times(rule, start_time):
+        if window_end is not None and occurrence_start_time >= window_end:
+            break
+        if window_start is None or occurrence_start_time + duration > window_start:
+            occurrences.append((occurrence_start_time, occurrence_start_time + duration))
+    return tuple(occurrences)
+
+
+def get_series_end_time(rule, start_time, end_time):
+    return expand(rule, start_time, end_time)[-1][1]
+
+
+def expand_rows(rows, window_start=None, window_end=None):
+    """Yield (start time, end time, ...) per occurrence in the window of (start time, end time, recurrence, ...) rows.
+
+    Rows that don't recur are passed on as they are, the query that selected them already checked the window.
+    """
+    for start_time, end_time, rule, *values in rows:
+        if not rule:
+            yield (start_time, end_time, *values)
+            continue
+        for occurrence_start_time, occurrence_end_time in expand(rule, start_time, end_time, window_start, window_end):
+            yield (occurrence_start_time, occurrence_end_time, *values)
+
+
+def occurrences_overlap(occurrences):
+    return any(next_start_time < previous_end_time for (_, previous_end_time), (next_start_time, _)
+               in zip(occurrences, occurrences[1:]))
+
+
+def intervals_overlap(intervals, other_intervals):
+    """Whether any interval of intervals overlaps one of other_intervals, which may not overlap each other."""
+    other_intervals = sorted(other_intervals)
+    other_starts = [start_time for start_time, _ in other_intervals]
+    for start_time, end_time in intervals:
+        index = bisect.bisect_left(other_starts, end_time)
+        if index > 0 and other_intervals[index - 1][1] > start_time:
+            return True
+    return False
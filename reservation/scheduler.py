@@ -0,0 +1,181 @@
+import bisect
+import collections
+import datetime
+
+from django.db import transaction
+
+from reservation.battery import get_distances_driven
+from reservation.models import Reservation, ChargingReservation, lock_car, occurring, overlapping
+from reservation.recurrence import expand_rows
+
+DEFAULT_HORIZON = datetime.timedelta(days=14)
+# Charges start on the half hour grid and end at least a step before the booking after them, like the slots
+# of Car.find_charging_slot
+STEP = datetime.timedelta(minutes=30)
+PRIORITY_ORDER = {Reservation.PRIORITY_HIGH: 0, Reservation.PRIORITY_MEDIUM: 1}
+
+Booking = collections.namedtuple('Booking', ['start_time', 'end_time', 'distance', 'reservation_id',
+                                             'should_be_charged_fully', 'priority'])
+Unmet = collections.namedtuple('Unmet', ['reservation_id', 'start_time', 'distance', 'priority', 'reason'])
+Schedule = collections.namedtuple('Schedule', ['keep', 'add', 'remove', 'unmet'])
+
+
+def floor_to_step(time):
+    return time - (time - time.replace(minute=0, second=0, microsecond=0)) % STEP
+
+
+class ChargingScheduler:
+    """
+    Plans the charges of a car between start_time and end_time.
+
+    The charging reservations that start in the horizon are replaced by the fewest charges that give every
+    reservation enough distance left, and a full battery when it should be charged fully. The timeline is loaded
+    with a fixed number of queries and swept once in time order. When a reservation is short, a charge goes in the
+    latest free gap since the last charge: that leaves the least driving before the reservation, so no other gap
+    can do better, and the battery is as full as possible for the reservations after it.
+    """
+
+    def __init__(self, car, start_time, end_time):
+        self.car = car
+        self.start_time = start_time
+        self.end_time = end_time
+        self.charging_duration = datetime.timedelta(hours=car.charging_time)
+        self.anchor = car.get_last_charging_time_before(start_time)
+
+        rows = car.reservation_set \
+            .filter(occurring(self.anchor, end_time)) \
+            .values_list('start_time', 'end_time', 'recurrence', 'distance', 'id', 'should_be_charged_fully',
+                         'priority')
+        self.reservations = sorted(Booking(*row) for row in expand_rows(rows, self.anchor, end_time))
+
+        self.fixed_charges = []
+        self.replaceable = []
+        for charging_reservation in car.chargingreservation_set.filter(overlapping(self.anchor, end_time)):
+            if charging_reservation.start_time >= start_time:
+                self.replaceable.append(charging_reservation)
+            else:
+                self.fixed_charges.append(charging_reservation)
+
+    def plan(self):
+        # Bookings the charges have to fit around, sorted by start time. They never overlap each other, so they are
+        # sorted by end time as well.
+        self.busy = sorted([(r.start_time, r.end_time) for r in self.reservations] +
+                           [(c.start_time, c.end_time) for c in self.fixed_charges])
+        self.busy_starts = [start_time for start_time, _ in self.busy]
+        self.kept = []
+        self.added = []
+        unmet = []
+
+        charge_ends = sorted(c.end_time for c in self.fixed_charges
+                             if c.end_time > self.anchor and self.car.is_full_charge(c.start_time, c.end_time))
+        self.partial_charges = [(c.end_time, self.car.get_charged_distance(c.start_time, c.end_time))
+                                for c in self.fixed_charges if not self.car.is_full_charge(c.start_time, c.end_time)]
+        self.last_charge_end = self.anchor
+        self.cycle = []
+        for reservation in self.reservations:
+            while charge_ends and charge_ends[0] <= reservation.start_time:
+                self.reset(charge_ends.pop(0))
+            if reservation.start_time < self.last_charge_end:
+                continue  # started before the battery cycle, so it doesn't count in it
+
+            if reservation.start_time >= self.start_time:
+                reason = self.get_shortage(reservation)
+                if reason is not None and self.add_charge(reservation):
+                    reason = self.get_shortage(reservation)
+                if reason is not None:
+                    unmet.append(Unmet(reservation.reservation_id, reservation.start_time, reservation.distance,
+                                       reservation.priority, reason))
+            self.cycle.append(reservation)
+
+        kept_ids = {charging_reservation.id for charging_reservation in self.kept}
+        unmet.sort(key=lambda entry: (PRIORITY_ORDER.get(entry.priority, 2), entry.start_time))
+        return Schedule(keep=self.kept, add=self.added,
+                        remove=[c for c in self.replaceable if c.id not in kept_ids], unmet=unmet)
+
+    def reset(self, charge_end):
+        self.last_charge_end = charge_end
+        self.cycle = [reservation for reservation in self.cycle if reservation.start_time >= charge_end]
+
+    def get_distance_driven(self, time):
+        changes = [(reservation.end_time, reservation.distance) for reservation in self.cycle]
+        changes += [(end_time, -charged_distance) for end_time, charged_distance in self.partial_charges
+                    if self.last_charge_end < end_time <= time]
+        changes.sort()
+        return get_distances_driven([change for _, change in changes])[-1] if changes else 0
+
+    def get_shortage(self, reservation):
+        distance_driven = self.get_distance_driven(reservation.start_time)
+        if distance_driven == 0:
+            return None  # a full battery is the best any charge can do
+        if reservation.should_be_charged_fully:
+            return 'not_charged_fully'
+        if self.car.get_driving_range(reservation.start_time) - distance_driven < reservation.distance:
+            return 'not_enough_distance_left'
+        return None
+
+    def add_charge(self, reservation):
+        """Charge in the latest gap before reservation that fits a charge, return whether one was added."""
+        # A charge before the first reservation of the cycle leaves the distance driven as it is
+        lower_bound = max(self.start_time, self.last_charge_end, self.cycle[0].start_time)
+        index = bisect.bisect_left(self.busy_starts, reservation.start_time)
+        gap_end = reservation.start_time
+        while gap_end > lower_bound and index > 0:
+            gap_start = max(self.busy[index - 1][1], lower_bound)
+            charge = self.find_charge(gap_start, gap_end)
+            if charge is not None:
+                if isinstance(charge, ChargingReservation):
+                    self.kept.append(charge)
+                    charge = (charge.start_time, charge.end_time)
+                else:
+                    self.added.append(charge)
+                bisect.insort(self.busy, charge)
+                self.busy_starts = [start_time for start_time, _ in self.busy]
+                self.reset(charge[1])
+                return True
+            index -= 1
+            gap_end = self.busy[index][0]
+        return False
+
+    def find_charge(self, gap_start, gap_end):
+        # Reuse a charge that is already there, so applying the schedule moves as little as possible
+        for charging_reservation in self.replaceable:
+            if charging_reservation not in self.kept and gap_start <= charging_reservation.start_time and \
+                    charging_reservation.end_time <= gap_end and \
+                    self.car.is_full_charge(charging_reservation.start_time, charging_reservation.end_time):
+                return charging_reservation
+
+        end_time = floor_to_step(gap_end) - STEP
+        start_time = end_time - self.charging_duration
+        if start_time < gap_start:
+            return None
+        return start_time, end_time
+
+
+def schedule_charging(car, start_time, end_time=None, dry_run=False):
+    """Plan the charges of car in the horizon and, unless dry_run, replace its charging reservations with them."""
+    if end_time is None:
+        end_time = start_time + DEFAULT_HORIZON
+    with transaction.atomic():
+        lock_car(car.id)
+        schedule = ChargingScheduler(car, start_time, end_time).plan()
+        if not dry_run:
+            # One at a time, so the receivers keep the battery cycles, the cache and open calendars up to date
+            for charging_reservation in schedule.remove:
+                charging_reservation.delete()
+            for charge_start_time, charge_end_time in schedule.add:
+                ChargingReservation(car=car, start_time=charge_start_time, end_time=charge_end_time).save()
+    return schedule
+
+
+def serialize_schedule(schedule):
+    def serialize_charge(charge):
+        if isinstance(charge, ChargingReservation):
+            return {'id': charge.id, 'start_time': charge.start_time, 'end_time': charge.end_time}
+        return {'id': None, 'start_time': charge[0], 'end_time': charge[1]}
+
+    return {
+        'keep': [serialize_charge(charge) for charge in schedule.keep],
+        'add': [serialize_charge(charge) for charge in schedule.add],
+        'remove': [serialize_charge(charge) for charge in schedule.remove],
+        'unmet': [entry._asdict() for entry in schedule.unmet],
+    }
@@ -0,0 +1,68 @@
+import bisect
+import datetime
+import functools
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+# Days are indexed as in a leap year, so February 29 has an entry of its own
+REFERENCE_YEAR = 2000
+DAYS_IN_YEAR = 366
+# Without temperatures, the range moves from the winter to the summer range in the month around April 1, and back
+# in the month around October 1
+TRANSITION_DAYS = 30
+
+
+def get_day_index(time):
+    if timezone.is_aware(time):
+        time = timezone.localtime(time)
+    return time.date().replace(year=REFERENCE_YEAR).timetuple().tm_yday - 1
+
+
+def get_date_index(month, day):
+    return datetime.date(REFERENCE_YEAR, month, day).timetuple().tm_yday - 1
+
+
+def get_temperatures():
+    """Return the mean temperature of every month from the DRIVING_RANGE_TEMPERATURES setting, if it is set."""
+    temperatures = getattr(settings, 'DRIVING_RANGE_TEMPERATURES', None)
+    if not temperatures:
+        return None
+    if len(temperatures) != 12:
+        raise ImproperlyConfigured("DRIVING_RANGE_TEMPERATURES needs a temperature for each of the 12 months")
+    return tuple(temperatures)
+
+
+def get_summer_fractions(temperatures=None):
+    """Return for every day of the year how far the range is from the winter range (0) to the summer range (1)."""
+    if temperatures is None:
+        spring = get_date_index(4, 1) - TRANSITION_DAYS / 2
+        autumn = get_date_index(10, 1) - TRANSITION_DAYS / 2
+        return [min(max((day - spring) / TRANSITION_DAYS, 0), 1) - min(max((day - autumn) / TRANSITION_DAYS, 0), 1)
+                for day in range(DAYS_IN_YEAR)]
+
+    # Every month's temperature holds on the 15th, with straight lines in between, around the year
+    days = [get_date_index(month, 15) for month in range(1, 13)]
+    days = [days[-1] - DAYS_IN_YEAR] + days + [days[0] + DAYS_IN_YEAR]
+    temperatures = [temperatures[-1]] + list(temperatures) + [temperatures[0]]
+    coldest, warmest = min(temperatures), max(temperatures)
+    fractions = []
+    for day in range(DAYS_IN_YEAR):
+        index = bisect.bisect_right(days, day)
+        temperature = temperatures[index - 1] + (temperatures[index] - temperatures[index - 1]) * \
+            (day - days[index - 1]) / (days[index] - days[index - 1])
+        fractions.append((temperature - coldest) / (warmest - coldest) if warmest > coldest else 1)
+    return fractions
+
+
+@functools.lru_cache(maxsize=1024)
+def get_range_curve(summer_driving_range, winter_driving_range, temperatures=None):
+    """
+    Return the driving range for every day of the year, see get_day_index.
+
+    The curve only depends on the arguments, so it is built once per process for every combination of them. Saving
+    a car with other driving ranges builds a new one.
+    """
+    return tuple(round(winter_driving_range + (summer_driving_range - winter_driving_range) * fraction)
+                 for fraction in get_summer_fractions(temperatures))
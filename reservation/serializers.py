@@ -1,4 +1,6 @@
 from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils.translation import gettext as _
 from rest_framework import serializers
 
 from reservation.models import Reservation, Car, Profile, ChargingReservation
@@ -29,6 +31,8 @@ class ReservationSerializer(serializers.ModelSerializer):
     distance_left = serializers.SerializerMethodField()
 
     def get_distance_left(self, reservation):
+        if 'distance_left' in self.context:
+            return self.context['distance_left'][reservation.id, reservation.start_time]
         return reservation.car.get_distance_left(reservation.start_time)
 
     class Meta:
@@ -41,3 +45,75 @@ class ChargingReservationSerializer(serializers.ModelSerializer):
     class Meta:
         model = ChargingReservation
         fields = ('id', 'car', 'start_time', 'end_time')
+
+
+class ReservationEventSerializer(serializers.ModelSerializer):
+    start = serializers.DateTimeField(source='start_time')
+    end = serializers.DateTimeField(source='end_time')
+    url = serializers.SerializerMethodField()
+    color = serializers.CharField(source='owner.profile.calendar_color')
+    title = serializers.SerializerMethodField()
+    type = serializers.SerializerMethodField()
+    editable = serializers.SerializerMethodField()
+    enoughDistanceLeft = serializers.SerializerMethodField(method_name='get_enough_distance_left')
+
+    def get_url(self, reservation):
+        return reverse('reservation:reservation', kwargs={'pk': reservation.id})
+
+    def get_title(self, reservation):
+        title = f"{capitalize_first_letter(reservation.owner.username)} · " \
+            f"{capitalize_first_letter(reservation.location)} · {reservation.distance} km \n"
+        if reservation.description:
+            title += f'"{reservation.description}"'
+        return title
+
+    def get_type(self, reservation):
+        return 'reservation'
+
+    def get_editable(self, reservation):
+        return False
+
+    def get_enough_distance_left(self, reservation):
+        return reservation.distance <= self.context['distance_left'][reservation.id, reservation.start_time]
+
+    class Meta:
+        model = Reservation
+        fields = ('id', 'start', 'end', 'url', 'color', 'title', 'type', 'editable', 'enoughDistanceLeft')
+
+
+class ChargingReservationEventSerializer(serializers.ModelSerializer):
+    start = serializers.DateTimeField(source='start_time')
+    end = serializers.DateTimeField(source='end_time')
+    url = serializers.SerializerMethodField()
+    color = serializers.SerializerMethodField()
+    title = serializers.SerializerMethodField()
+    type = serializers.SerializerMethodField()
+    editable = serializers.SerializerMethodField()
+    durationEditable = serializers.SerializerMethodField(method_name='get_duration_editable')
+
+    def get_url(self, charging_reservation):
+        return reverse('reservation:charging_reservation', kwargs={'pk': charging_reservation.id})
+
+    def get_color(self, charging_reservation):
+        return '#868e96'
+
+    def get_title(self, charging_reservation):
+        # Translators: Charging reservation title
+        return _("Charging")
+
+    def get_type(self, charging_reservation):
+        return 'charging_reservation'
+
+    def get_editable(self, charging_reservation):
+        return True
+
+    def get_duration_editable(self, charging_reservation):
+        return False
+
+    class Meta:
+        model = ChargingReservation
+        fields = ('id', 'start', 'end', 'url', 'color', 'title', 'type', 'editable', 'durationEditable')
+
+
+def capitalize_first_letter(string):
+    return string[:1].upper() + string[1:]
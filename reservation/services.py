@@ -0,0 +1,43 @@
+import collections
+import datetime
+
+from django.db import transaction
+
+from reservation.models import ChargingReservation, OverlapError, lock_car
+
+ReservationResult = collections.namedtuple('ReservationResult', ['reservation', 'charging_reservation'])
+
+
+class ReservationService:
+    def __init__(self, car):
+        self.car = car
+
+    def save(self, reservation):
+        """Save the reservation together with the charging reservation it needs, if there is room for one."""
+        with transaction.atomic():
+            lock_car(self.car.id)
+            charging_reservation = self.add_charging_reservation(reservation)
+            reservation.save()
+        return ReservationResult(reservation, charging_reservation)
+
+    def add_charging_reservation(self, reservation):
+        start_time = reservation.start_time
+        last_charging_time = self.car.get_last_charging_time_before(start_time)
+        distance_left = self.car.get_distance_left(start_time, exclude_reservation_id=reservation.id,
+                                                   last_charging_time=last_charging_time)
+        if distance_left >= reservation.distance or distance_left == self.car.get_driving_range(start_time):
+            return None
+
+        charging_slot = self.car.find_charging_slot_after(last_charging_time, start_time,
+                                                          exclude_reservation_id=reservation.id)
+        if charging_slot is None:
+            return None
+
+        charging_reservation = ChargingReservation(car=self.car, start_time=charging_slot,
+                                                   end_time=charging_slot + datetime.timedelta(
+                                                       hours=self.car.charging_time))
+        try:
+            charging_reservation.save()
+        except OverlapError:
+            return None
+        return charging_reservation
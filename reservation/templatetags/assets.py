@@ -0,0 +1,24 @@
+from urllib.parse import urljoin
+
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html_join
+
+from reservation.assets import BUNDLES, get_manifest
+
+register = template.Library()
+
+
+@register.simple_tag
+def bundle(name):
+    """Render the tags that load bundle name: the bundle when it is built, the separate files otherwise."""
+    manifest = get_manifest()
+    if manifest and name in manifest:
+        # Already hashed, so it doesn't go through the static files storage
+        urls = [urljoin(settings.STATIC_URL, manifest[name])]
+    else:
+        urls = [static(path) for path in BUNDLES[name]]
+    if name.endswith('.css'):
+        return format_html_join('\n', '<link rel="stylesheet" href="{}">', ((url,) for url in urls))
+    return format_html_join('\n', '<script src="{}"></script>', ((url,) for url in urls))
@@ -1,3 +1,1004 @@
-from django.test import TestCase
+import datetime
+import gzip
+import io
+import json
+import os
+import queue
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from reservation.assets import BUNDLE_DIR, build_bundles
+from reservation.battery import BatteryTimeline, get_distance_left_for_reservations, get_distances_driven
+from reservation.benchmarks import find_charging_slot_stepwise, run_benchmarks
+from reservation.forms import ChargingReservationAddForm, ReservationAddForm
+from reservation.ical import get_feed_token
+from reservation.metrics import clear_samples, get_metrics
+from reservation.models import Car, Reservation, ChargingReservation, BatteryCycle, OverlapError, overlapping
+from reservation.scheduler import ChargingScheduler, schedule_charging
+from reservation.seasons import get_range_curve
+from reservation.services import ReservationService
+from reservation.updates import Broker, broker
+
+
+def create_car(name='Car', **kwargs):
+    return Car.objects.create(name=name, **{'summer_driving_range': 300, 'winter_driving_range': 200,
+                                            'charging_time': 4, **kwargs})
+
+
+class CacheTestCase(TestCase):
+    """Starts from an empty cache. Invalidation waits for the commit, which never comes in a test case."""
+
+    def setUp(self):
+        cache.clear()
+
+
+class CarUserTestCase(CacheTestCase):
+    """Logs in as a user of a car, created with car_options."""
+    car_options = {}
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.car = create_car(**self.car_options)
+        self.car.users.add(self.user)
+        self.client.login(username='user', password='password')
+
+
+class BatteryTimelineTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='user')
+        self.car = create_car()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3))
+        for i in range(12):
+            Reservation.objects.create(owner=self.user, car=self.car, distance=40 + 10 * i, location='Location',
+                                       start_time=self.at(6 * i), end_time=self.at(6 * i + 2))
+        for start_hours, end_hours in ((-4, 0), (20, 24), (45, 47)):
+            ChargingReservation.objects.create(car=self.car, start_time=self.at(start_hours),
+                                               end_time=self.at(end_hours))
+
+    def at(self, hours):
+        return self.start_time + datetime.timedelta(hours=hours)
+
+    def test_matches_the_distance_left_per_reservation(self):
+        reservations = list(self.car.reservation_set.all())
+        with self.assertNumQueries(3):
+            distance_left = get_distance_left_for_reservations(self.car, reservations)
+        for reservation in reservations:
+            self.assertEqual(distance_left[reservation.id, reservation.start_time],
+                             self.car.get_distance_left(reservation.start_time))
+
+        timeline = BatteryTimeline(self.car, self.at(0), self.at(72))
+        for hours in range(72):
+            self.assertEqual(timeline.get_distance_left(self.at(hours)), self.car.get_distance_left(self.at(hours)))
+
+
+class APIReservationsListQueryCountTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3))
+
+    def create_reservations(self, count):
+        owners = [self.user] + [User.objects.create(username=f'owner-{i}') for i in range(3)]
+        Reservation.objects.bulk_create(
+            Reservation(owner=owners[i % len(owners)], car=self.car, distance=1, location='Location',
+                        start_time=self.start_time + datetime.timedelta(hours=i),
+                        end_time=self.start_time + datetime.timedelta(hours=i, minutes=30))
+            for i in range(count)
+        )
+
+    def count_queries(self, url_name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f'/api/car/{self.car.id}/{url_name}/', {
+                'start': self.start_time.isoformat(),
+                'end': (self.start_time + datetime.timedelta(days=30)).isoformat(),
+            })
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.json()
+
+    def assert_constant_query_count(self, url_name):
+        # Resolve the cars of the user once, like any earlier request in the session would
+        self.client.get(f'/api/car/{self.car.id}/distance_left/')
+        query_counts = []
+        for count in (1, 10, 500):
+            with self.captureOnCommitCallbacks(execute=True):
+                Reservation.objects.all().delete()
+                User.objects.exclude(pk=self.user.pk).delete()
+                self.create_reservations(count)
+            query_count, events = self.count_queries(url_name)
+            self.assertEqual(len(events), count)
+            query_counts.append(query_count)
+        self.assertEqual(len(set(query_counts)), 1, query_counts)
+
+    def test_reservations_query_count_is_constant(self):
+        self.assert_constant_query_count('reservations')
+
+    def test_events_query_count_is_constant(self):
+        self.assert_constant_query_count('events')
+
+
+class APICarEventsTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3, 8))
+        self.reservation = Reservation.objects.create(owner=self.user, car=self.car, distance=250, location='gent',
+                                                      description='Trip', start_time=self.start_time,
+                                                      end_time=self.start_time + datetime.timedelta(hours=2))
+        self.too_far = Reservation.objects.create(owner=self.user, car=self.car, distance=100, location='Brugge',
+                                                  start_time=self.start_time + datetime.timedelta(hours=3),
+                                                  end_time=self.start_time + datetime.timedelta(hours=4))
+        self.charging_reservation = ChargingReservation.objects.create(
+            car=self.car, start_time=self.start_time - datetime.timedelta(hours=4), end_time=self.start_time)
+        Reservation.objects.create(owner=self.user, car=self.car, distance=10, location='Later',
+                                   start_time=self.start_time + datetime.timedelta(days=8),
+                                   end_time=self.start_time + datetime.timedelta(days=8, hours=1))
+
+    def get_events(self):
+        return self.client.get(f'/api/car/{self.car.id}/events/', {
+            'start': (self.start_time - datetime.timedelta(days=1)).isoformat(),
+            'end': (self.start_time + datetime.timedelta(days=6)).isoformat(),
+        })
+
+    def test_payload(self):
+        events = {(event['type'], event['id']): event for event in self.get_events().json()}
+        self.assertEqual(set(events), {('reservation', self.reservation.id), ('reservation', self.too_far.id),
+                                       ('charging_reservation', self.charging_reservation.id)})
+
+        event = events['reservation', self.reservation.id]
+        self.assertEqual(event['title'], 'User · Gent · 250 km \n"Trip"')
+        self.assertEqual(event['url'], f'/reservation/{self.reservation.id}/')
+        self.assertEqual(datetime.datetime.fromisoformat(event['start']), self.start_time)
+        self.assertFalse(event['editable'])
+        self.assertTrue(event['enoughDistanceLeft'])
+        self.assertFalse(events['reservation', self.too_far.id]['enoughDistanceLeft'])
+
+        event = events['charging_reservation', self.charging_reservation.id]
+        self.assertEqual(event['url'], f'/charging_reservation/{self.charging_reservation.id}/')
+        self.assertTrue(event['editable'])
+        self.assertFalse(event['durationEditable'])
+
+    def test_only_users_of_the_car_get_its_events(self):
+        self.car.users.remove(self.user)
+        self.assertEqual(self.get_events().status_code, 403)
+        self.client.logout()
+        self.assertEqual(self.get_events().status_code, 302)
+
+
+class CarCacheInvalidationTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3))
+
+    def get_events(self):
+        return self.client.get(f'/api/car/{self.car.id}/events/', {
+            'start': self.start_time.isoformat(),
+            'end': (self.start_time + datetime.timedelta(days=7)).isoformat(),
+        }).json()
+
+    def test_saving_a_reservation_invalidates_the_cached_events(self):
+        self.assertEqual(self.get_events(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = Reservation.objects.create(owner=self.user, car=self.car, distance=250,
+                                                     location='Location', start_time=self.start_time,
+                                                     end_time=self.start_time + datetime.timedelta(hours=1))
+            # Until the reservation commits, the cached events stay as they are
+            self.assertEqual(self.get_events(), [])
+        self.assertEqual([event['id'] for event in self.get_events()], [reservation.id])
+
+        self.car.summer_driving_range = 200
+        with self.captureOnCommitCallbacks(execute=True):
+            self.car.save()
+        self.assertFalse(self.get_events()[0]['enoughDistanceLeft'])
+
+
+class CarAPIConditionalGetTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3))
+
+    def get_reservations(self, **headers):
+        return self.client.get(f'/api/car/{self.car.id}/reservations/', {
+            'start': self.start_time.isoformat(),
+            'end': (self.start_time + datetime.timedelta(days=7)).isoformat(),
+        }, **headers)
+
+    def test_unchanged_car_answers_not_modified(self):
+        etag = self.get_reservations()['ETag']
+        self.assertEqual(self.get_reservations(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Reservation.objects.create(owner=self.user, car=self.car, distance=10, location='Location',
+                                       start_time=self.start_time,
+                                       end_time=self.start_time + datetime.timedelta(hours=1))
+        response = self.get_reservations(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_distance_left_now_changes_with_the_hour(self):
+        def get_distance_left(now, **headers):
+            with mock.patch('django.utils.timezone.now', return_value=now):
+                return self.client.get(f'/api/car/{self.car.id}/distance_left/', **headers)
+
+        now = self.start_time + datetime.timedelta(hours=10, minutes=5)
+        etag = get_distance_left(now)['ETag']
+        self.assertEqual(get_distance_left(now + datetime.timedelta(minutes=30), HTTP_IF_NONE_MATCH=etag).status_code,
+                         304)
+        response = get_distance_left(now + datetime.timedelta(hours=1), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class DistanceProfileTest(CarUserTestCase):
+    car_options = {'charging_time': 2}
+
+    def setUp(self):
+        super().setUp()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3))
+
+    def get_profile(self, days, step):
+        return self.client.get(f'/api/car/{self.car.id}/distance_profile/', {
+            'start': self.start_time.isoformat(),
+            'end': (self.start_time + datetime.timedelta(days=days)).isoformat(),
+            'step': step,
+        })
+
+    def test_profile_matches_distance_left(self):
+        for i in range(6):
+            Reservation.objects.create(owner=self.user, car=self.car, distance=20, location='Location',
+                                       start_time=self.start_time + datetime.timedelta(hours=5 * i),
+                                       end_time=self.start_time + datetime.timedelta(hours=5 * i + 2))
+        ChargingReservation.objects.create(car=self.car, start_time=self.start_time + datetime.timedelta(hours=7),
+                                           end_time=self.start_time + datetime.timedelta(hours=10))
+
+        points = self.get_profile(1, 30).json()
+        self.assertEqual(len(points), 49)
+        for point in points:
+            time = datetime.datetime.fromisoformat(point['time'])
+            self.assertEqual(point['distance_left'], self.car.get_distance_left(time))
+
+    def test_invalid_step(self):
+        for step in ('half an hour', '0', '1'):
+            response = self.get_profile(7, step)
+            self.assertEqual(response.status_code, 400, step)
+            self.assertIn('step', response.json())
+
+
+class OverlapQueryIndexTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        owner = User.objects.create(username='owner')
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 1, 1))
+        self.cars = [create_car(f'Car {i}') for i in range(10)]
+        for car in self.cars:
+            Reservation.objects.bulk_create(
+                Reservation(owner=owner, car=car, distance=1, location='Location',
+                            start_time=self.start_time + datetime.timedelta(hours=2 * i),
+                            end_time=self.start_time + datetime.timedelta(hours=2 * i + 1))
+                for i in range(2000)
+            )
+            ChargingReservation.objects.bulk_create(
+                ChargingReservation(car=car,
+                                    start_time=self.start_time + datetime.timedelta(hours=2 * i + 1),
+                                    end_time=self.start_time + datetime.timedelta(hours=2 * i + 2))
+                for i in range(2000)
+            )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def test_reservation_spanning_the_window_is_found(self):
+        car = self.cars[0]
+        reservation = Reservation.objects.filter(car=car).first()
+        window_start = reservation.start_time + datetime.timedelta(minutes=10)
+        window_end = reservation.end_time - datetime.timedelta(minutes=10)
+        self.assertEqual(list(Reservation.objects.filter(Q(car=car) & overlapping(window_start, window_end))),
+                         [reservation])
+
+    def test_overlap_queries_use_the_car_time_index(self):
+        window_start = self.start_time + datetime.timedelta(days=30)
+        window_end = window_start + datetime.timedelta(days=7)
+        for model in (Reservation, ChargingReservation):
+            plan = model.objects.filter(Q(car=self.cars[3]) & overlapping(window_start, window_end)).explain()
+            self.assertIn(model._meta.indexes[0].name, plan)
+
+
+class BookingOverlapTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='user')
+        self.car = create_car()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3, 8))
+        self.reservation = Reservation.objects.create(owner=self.user, car=self.car, distance=10,
+                                                      location='Location', start_time=self.start_time,
+                                                      end_time=self.start_time + datetime.timedelta(hours=2))
+
+    def test_overlapping_bookings_are_refused(self):
+        with self.assertRaises(OverlapError):
+            Reservation.objects.create(owner=self.user, car=self.car, distance=10, location='Location',
+                                       start_time=self.start_time + datetime.timedelta(hours=1),
+                                       end_time=self.start_time + datetime.timedelta(hours=3))
+        with self.assertRaises(OverlapError):
+            ChargingReservation.objects.create(car=self.car, start_time=self.start_time - datetime.timedelta(hours=3),
+                                               end_time=self.start_time + datetime.timedelta(minutes=30))
+        self.assertEqual(Reservation.objects.count() + ChargingReservation.objects.count(), 1)
+
+    def test_adjacent_bookings_and_updates_are_allowed(self):
+        ChargingReservation.objects.create(car=self.car, start_time=self.start_time - datetime.timedelta(hours=4),
+                                           end_time=self.start_time)
+        self.reservation.end_time = self.start_time + datetime.timedelta(hours=3)
+        self.reservation.save()
+
+
+class ReservationServiceTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='user')
+        self.car = create_car(summer_driving_range=100, winter_driving_range=100)
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3, 8))
+        Reservation.objects.create(owner=self.user, car=self.car, distance=80, location='Location',
+                                   start_time=self.start_time, end_time=self.start_time + datetime.timedelta(hours=2))
+
+    def new_reservation(self, hours_later):
+        return Reservation(owner=self.user, car=self.car, distance=50, location='Location',
+                           start_time=self.start_time + datetime.timedelta(hours=hours_later),
+                           end_time=self.start_time + datetime.timedelta(hours=hours_later + 1))
+
+    def test_reservation_is_saved_with_the_charging_reservation_it_needs(self):
+        result = ReservationService(self.car).save(self.new_reservation(12))
+        self.assertIsNotNone(result.reservation.pk)
+        self.assertEqual(list(ChargingReservation.objects.all()), [result.charging_reservation])
+        self.assertEqual(self.car.get_distance_left(result.reservation.start_time), 100)
+
+    def test_overlapping_reservation_leaves_no_charging_reservation_behind(self):
+        self.car.reservation_set.create(owner=self.user, distance=1, location='Location',
+                                        start_time=self.start_time + datetime.timedelta(hours=12),
+                                        end_time=self.start_time + datetime.timedelta(hours=13))
+        with self.assertRaises(OverlapError):
+            ReservationService(self.car).save(self.new_reservation(12))
+        self.assertFalse(ChargingReservation.objects.exists())
+
+
+class BatteryCycleTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='user')
+        self.car = create_car()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3))
+
+    def add_reservation(self, hours_later, distance):
+        return Reservation.objects.create(owner=self.user, car=self.car, distance=distance, location='Location',
+                                          start_time=self.start_time + datetime.timedelta(hours=hours_later),
+                                          end_time=self.start_time + datetime.timedelta(hours=hours_later + 1))
+
+    def add_charging_reservation(self, hours_later, hours):
+        return ChargingReservation.objects.create(
+            car=self.car, start_time=self.start_time + datetime.timedelta(hours=hours_later),
+            end_time=self.start_time + datetime.timedelta(hours=hours_later + hours))
+
+    def get_cycles(self):
+        return list(self.car.batterycycle_set.order_by('start_time').values_list('start_time', 'distance_driven'))
+
+    def test_cycles_follow_bookings(self):
+        self.add_reservation(0, 50)
+        charging_reservation = self.add_charging_reservation(2, 4)
+        self.add_charging_reservation(7, 1)
+        reservation = self.add_reservation(10, 30)
+        self.add_reservation(12, 20)
+        self.assertEqual(self.get_cycles(), [(self.start_time + datetime.timedelta(hours=6), 50)])
+
+        charging_reservation.end_time -= datetime.timedelta(hours=1)
+        charging_reservation.save()
+        self.assertEqual(self.get_cycles(), [])
+
+        self.car.charging_time = 1
+        self.car.save()
+        self.assertEqual(self.get_cycles(), [(self.start_time + datetime.timedelta(hours=5), 0),
+                                             (self.start_time + datetime.timedelta(hours=8), 50)])
+
+        reservation.delete()
+        self.assertEqual(self.get_cycles()[-1], (self.start_time + datetime.timedelta(hours=8), 20))
+        self.assertEqual(self.car.get_distance_left(self.start_time + datetime.timedelta(hours=13)), 280)
+
+        snapshot = self.get_cycles()
+        BatteryCycle.rebuild(self.car)
+        self.assertEqual(self.get_cycles(), snapshot)
+
+    def test_partial_charges(self):
+        self.add_charging_reservation(-4, 4)
+        self.add_reservation(0, 200)
+        self.add_charging_reservation(2, 2)
+        time = self.start_time + datetime.timedelta(hours=5)
+        # Two of the four hours restore half of the 300 km range
+        self.assertEqual(self.get_cycles(), [(self.start_time, 50)])
+        self.assertEqual(self.car.get_distance_left(time), 250)
+        self.assertEqual(self.car.get_distance_left(time, last_charging_time=self.start_time), 250)
+        self.assertEqual(BatteryTimeline(self.car, time, time).get_distance_left(time), 250)
+
+        # A partial charge stops when the battery is full
+        self.add_charging_reservation(5, 3)
+        self.add_reservation(9, 100)
+        time = self.start_time + datetime.timedelta(hours=11)
+        self.assertEqual(self.car.get_distance_left(time), 200)
+        self.assertEqual(self.car.get_distance_left(time, last_charging_time=self.start_time), 200)
+        self.assertEqual(BatteryTimeline(self.car, time, time).get_distance_left(time), 200)
+
+    def test_one_hour_top_up_form(self):
+        self.add_charging_reservation(-4, 4)
+        self.add_reservation(0, 200)
+        form = ChargingReservationAddForm({
+            'start_time': (self.start_time + datetime.timedelta(hours=2)).strftime('%Y-%m-%d %H:%M'),
+            'end_time': (self.start_time + datetime.timedelta(hours=3)).strftime('%Y-%m-%d %H:%M'),
+        }, car=self.car)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        # One of the four hours restores a quarter of the 300 km range
+        self.assertEqual(self.car.get_distance_left(self.start_time + datetime.timedelta(hours=4)), 175)
+
+    def test_distances_driven(self):
+        self.assertEqual(get_distances_driven([100, -150, 50, -20, 30]), [100, 0, 50, 30, 60])
+
+
+class BenchmarkTest(CacheTestCase):
+    # Upper bounds on the number of queries per call, independent of the size of the calendar
+    query_budgets = {
+        'api_reservations': 8,
+        'api_charging_reservations': 3,
+        'api_distance_left': 6,
+        'find_charging_slot': 6,
+        'reservation_add_form_save': 25,
+    }
+
+    def test_query_budgets(self):
+        results = run_benchmarks(days=14, samples=3)
+        self.assertEqual(set(results), set(self.query_budgets))
+        for name, budget in self.query_budgets.items():
+            with self.subTest(name):
+                self.assertLessEqual(results[name]['queries'], budget)
+
+
+class ChargingSlotDaylightSavingTimeTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='user')
+        self.car = create_car()
+
+    def assert_slots_avoid_the_bookings(self, day):
+        start_time = timezone.make_aware(datetime.datetime(*day)) - datetime.timedelta(days=1)
+        ChargingReservation.objects.create(car=self.car, start_time=start_time - datetime.timedelta(hours=4),
+                                           end_time=start_time)
+        # Five hours between the bookings leave room for the four hours of charging, and the bookings end on the
+        # hour and on the half hour
+        for minutes in range(60, 48 * 60, 6 * 60 + 30):
+            Reservation.objects.create(owner=self.user, car=self.car, distance=10, location='Location',
+                                       start_time=start_time + datetime.timedelta(minutes=minutes),
+                                       end_time=start_time + datetime.timedelta(minutes=minutes + 90))
+
+        charging_duration = datetime.timedelta(hours=self.car.charging_time)
+        step = datetime.timedelta(minutes=30)
+        for minutes in range(6 * 60, 48 * 60, 20):
+            # Local times, like the ones the forms give
+            time = timezone.localtime(start_time + datetime.timedelta(minutes=minutes))
+            slot = self.car.find_charging_slot(time)
+            self.assertEqual(slot, find_charging_slot_stepwise(self.car, time.astimezone(datetime.timezone.utc)),
+                             time)
+            if slot is not None:
+                self.assertTrue(self.car.time_slot_free(slot + step, slot + step + charging_duration), time)
+
+    def test_clocks_go_forward(self):
+        self.assert_slots_avoid_the_bookings((2019, 3, 31))
+
+    def test_clocks_go_back(self):
+        self.assert_slots_avoid_the_bookings((2019, 10, 27))
+
+
+class RequestMetricsTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.params = {'start': '2019-06-03T00:00:00+02:00', 'end': '2019-06-10T00:00:00+02:00'}
+        clear_samples()
+
+    def test_sampled_request_is_measured(self):
+        with self.settings(REQUEST_METRICS_SAMPLE_RATE=1):
+            response = self.client.get(f'/api/car/{self.car.id}/reservations/', self.params)
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('serializer;dur=', response['Server-Timing'])
+        self.assertEqual(get_metrics()['api_car_reservations']['count'], 1)
+
+        with self.settings(REQUEST_METRICS_SAMPLE_RATE=0):
+            response = self.client.get(f'/api/car/{self.car.id}/reservations/', self.params)
+        self.assertFalse(response.has_header('Server-Timing'))
+        self.assertEqual(get_metrics()['api_car_reservations']['count'], 1)
+
+    def test_metrics_are_staff_only(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+
+        self.user.is_staff = True
+        self.user.save()
+        with self.settings(REQUEST_METRICS_SAMPLE_RATE=1):
+            self.client.get(f'/api/car/{self.car.id}/charging_reservations/', self.params)
+        metrics = self.client.get('/api/metrics/').json()
+        self.assertEqual(metrics['api_car_charging_reservations']['count'], 1)
+        self.assertEqual(sum(bucket['count'] for bucket in metrics['api_car_charging_reservations']['histogram']), 1)
+
+
+class CarPermissionTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/car/{self.car.id}/distance_left/'
+
+    def test_membership_is_cached_until_the_users_change(self):
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertFalse([query for query in queries if 'reservation_car_users' in query['sql']])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.car.users.remove(self.user)
+            # Until the removal commits, the cached membership stays as it is
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.car_set.add(self.car)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.car.users.clear()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_login_leaves_the_cached_feeds_alone(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.login(username='user', password='password')
+        self.assertEqual(callbacks, [])
+
+
+class BookingDetailQueryCountTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3, 8))
+        self.reservation = Reservation.objects.create(owner=self.user, car=self.car, distance=10,
+                                                      location='Location', start_time=self.start_time,
+                                                      end_time=self.start_time + datetime.timedelta(hours=1))
+        self.charging_reservation = ChargingReservation.objects.create(
+            car=self.car, start_time=self.start_time + datetime.timedelta(hours=2),
+            end_time=self.start_time + datetime.timedelta(hours=6))
+        # Resolve the cars of the user once, like any earlier request in the session would
+        self.client.get(f'/api/car/{self.car.id}/distance_left/')
+
+    def post(self, url, max_queries, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, data or {})
+        self.assertEqual(response.status_code, 302)
+        self.assertLessEqual(len(queries), max_queries)
+        return [query['sql'] for query in queries]
+
+    def assert_single_lookup(self, queries, table):
+        lookups = [sql for sql in queries if sql.startswith(f'SELECT "{table}"."id", ') and
+                   f'WHERE "{table}"."id" = ' in sql]
+        self.assertEqual(len(lookups), 1, lookups)
+
+    def test_reservation_update(self):
+        queries = self.post(f'/reservation/{self.reservation.id}/', 20, {
+            'description': '', 'distance': 20, 'location': 'Location', 'priority': Reservation.PRIORITY_LOW,
+            'start_time': '2019-06-03 08:00', 'end_time': '2019-06-03 09:30',
+        })
+        self.assert_single_lookup(queries, 'reservation_reservation')
+        self.assertFalse([sql for sql in queries if sql.startswith('SELECT') and 'FROM "reservation_car" ' in sql])
+
+    def test_reservation_delete(self):
+        queries = self.post(f'/reservation/{self.reservation.id}/delete/', 9)
+        self.assert_single_lookup(queries, 'reservation_reservation')
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_charging_reservation_delete(self):
+        queries = self.post(f'/charging_reservation/{self.charging_reservation.id}/delete/', 9)
+        self.assert_single_lookup(queries, 'reservation_chargingreservation')
+        self.assertFalse(ChargingReservation.objects.exists())
+
+
+class ProfileLastCarTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.cars = [create_car(f'Car {i}') for i in range(2)]
+        self.user.car_set.add(*self.cars)
+        self.client.login(username='user', password='password')
+
+    def get_updates(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 302 if url == '/' else 200)
+        return [query['sql'] for query in queries if query['sql'].startswith('UPDATE "reservation_profile"')]
+
+    def test_fallback_car_is_saved(self):
+        self.assertEqual(len(self.get_updates('/')), 1)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.last_car, self.cars[0])
+        self.assertEqual(self.get_updates('/'), [])
+
+    def test_calendar_only_writes_when_the_car_changes(self):
+        self.assertEqual(len(self.get_updates(f'/calendar/{self.cars[1].id}/')), 1)
+        self.assertEqual(self.get_updates(f'/calendar/{self.cars[1].id}/'), [])
+        self.assertEqual(len(self.get_updates(f'/calendar/{self.cars[0].id}/')), 1)
+        self.user.profile.refresh_from_db()
+        self.assertEqual(self.user.profile.last_car, self.cars[0])
+
+
+class CarFeedTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.car = create_car()
+        self.car.users.add(self.user)
+        start_time = timezone.make_aware(datetime.datetime(2019, 6, 3, 8))
+        Reservation.objects.create(owner=self.user, car=self.car, distance=10, location='Gent, station',
+                                   description='A description that is long enough to be folded over lines',
+                                   start_time=start_time, end_time=start_time + datetime.timedelta(hours=1))
+        ChargingReservation.objects.create(car=self.car, start_time=start_time + datetime.timedelta(hours=2),
+                                           end_time=start_time + datetime.timedelta(hours=6))
+        self.url = f'/car/{self.car.id}/feed.ics'
+        self.token = get_feed_token(self.user, self.car)
+
+    def test_feed(self):
+        response = self.client.get(self.url, {'token': self.token})
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        self.assertTrue(all(len(line.encode()) <= 75 for line in content.split('\r\n')))
+        self.assertEqual(content.count('BEGIN:VEVENT'), 2)
+        self.assertIn('DTSTART:20190603T060000Z', content)
+        self.assertIn('SUMMARY:User · Gent\\, station · 10 km', content)
+
+        response = self.client.get(self.url, {'token': self.token}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_token(self):
+        self.assertEqual(self.client.get(self.url, {'token': 'invalid'}).status_code, 404)
+        other_car = create_car('Other')
+        other_token = get_feed_token(self.user, other_car)
+        self.assertEqual(self.client.get(self.url, {'token': other_token}).status_code, 404)
+
+        self.car.users.remove(self.user)
+        self.assertEqual(self.client.get(self.url, {'token': self.token}).status_code, 404)
+
+
+class CarUpdatesTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3, 8))
+
+    def test_stream_pushes_changes(self):
+        response = self.client.get(f'/api/car/{self.car.id}/updates/')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        stream = iter(response.streaming_content)
+        self.assertIn(b'retry:', next(stream))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation = Reservation.objects.create(owner=self.user, car=self.car, distance=10,
+                                                     location='Location', start_time=self.start_time,
+                                                     end_time=self.start_time + datetime.timedelta(hours=1))
+        self.assertIn(b'event: reset', next(stream))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reservation.delete()
+        self.assertIn(b'event: reset', next(stream))
+        response.close()
+
+    @override_settings(MIDDLEWARE=['django.middleware.gzip.GZipMiddleware'] + settings.MIDDLEWARE)
+    def test_stream_is_not_compressed(self):
+        response = self.client.get(f'/api/car/{self.car.id}/updates/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn(b'retry:', next(iter(response.streaming_content)))
+        response.close()
+
+    def test_changes_reach_the_streams_of_other_processes(self):
+        # Every broker stands in for the one of another worker process, they only share the cache
+        subscription = Broker(poll_interval=0).subscribe(self.car.id)
+        with self.assertRaises(queue.Empty):
+            subscription.get(0)
+        Broker().publish(self.car.id)
+        self.assertNotEqual(subscription.get(0), subscription.current_event_id)
+
+    def test_reconnect_after_missed_changes(self):
+        first_event_id = broker.subscribe(self.car.id).current_event_id
+        with self.assertRaises(queue.Empty):
+            broker.subscribe(self.car.id, first_event_id).get(0)
+        broker.publish(self.car.id)
+        self.assertNotEqual(broker.subscribe(self.car.id, first_event_id).get(0), first_event_id)
+
+
+class BulkReservationsTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = f'/api/car/{self.car.id}/reservations/bulk/'
+        start_time = timezone.make_aware(datetime.datetime(2019, 6, 3, 8))
+        Reservation.objects.create(owner=self.user, car=self.car, distance=10, location='Existing',
+                                   start_time=start_time, end_time=start_time + datetime.timedelta(hours=1))
+
+    def test_import(self):
+        rows = [
+            {'start_time': '2019-06-04 08:00', 'end_time': '2019-06-04 10:00', 'distance': 280, 'location': 'B'},
+            {'start_time': '2019-06-03 08:30', 'end_time': '2019-06-03 09:30', 'distance': 10, 'location': 'A'},
+            {'start_time': '2019-06-03 12:00', 'end_time': '2019-06-03 14:00', 'distance': 20, 'location': 'C'},
+            {'start_time': '2019-06-03 13:00', 'end_time': '2019-06-03 15:00', 'distance': 10, 'location': 'D'},
+            {'start_time': 'tomorrow', 'end_time': '2019-06-03 15:00', 'distance': 10, 'location': 'E'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, json.dumps(rows), content_type='application/json')
+        self.assertLess(len(queries), 20)
+        result = response.json()
+        self.assertEqual(result['created'], 2)
+        self.assertEqual([entry['status'] for entry in result['rows']],
+                         ['created', 'overlap', 'created', 'overlap', 'invalid'])
+        self.assertEqual(result['rows'][0]['distance_left'], 270)
+        self.assertIn('warnings', result['rows'][0])
+        self.assertIn('start_time', result['rows'][4]['errors'])
+
+        self.assertEqual(sorted(self.car.reservation_set.values_list('location', flat=True)), ['B', 'C', 'Existing'])
+        self.assertEqual(self.car.get_distance_left(timezone.make_aware(datetime.datetime(2019, 6, 5))), -10)
+
+    def test_export_round_trip(self):
+        response = self.client.get(self.url, {'format': 'csv'})
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(content.splitlines()[1], '2019-06-03 08:00:00,2019-06-03 09:00:00,10,Existing,,L,')
+
+        response = self.client.post(self.url + '?dry_run=1', content, content_type='text/csv')
+        self.assertEqual([entry['status'] for entry in response.json()['rows']], ['overlap'])
+
+        Reservation.objects.all().delete()
+        response = self.client.post(self.url, content, content_type='text/csv')
+        self.assertEqual(response.json()['created'], 1)
+
+
+class RecurringReservationTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3, 8))
+        self.series = Reservation.objects.create(owner=self.user, car=self.car, distance=50, location='Work',
+                                                 start_time=self.start_time,
+                                                 end_time=self.start_time + datetime.timedelta(hours=1),
+                                                 recurrence='FREQ=WEEKLY;COUNT=4')
+
+    def test_recurrence_end_time(self):
+        self.assertEqual(self.series.recurrence_end_time, self.start_time + datetime.timedelta(weeks=3, hours=1))
+
+    def test_events_window(self):
+        response = self.client.get(f'/api/car/{self.car.id}/events/', {
+            'start': (self.start_time + datetime.timedelta(days=6)).isoformat(),
+            'end': (self.start_time + datetime.timedelta(days=15)).isoformat(),
+        })
+        starts = sorted(event['start'] for event in response.json() if event['type'] == 'reservation')
+        self.assertEqual(starts, [(self.start_time + datetime.timedelta(weeks=weeks)).isoformat()
+                                  for weeks in (1, 2)])
+
+    def test_overlap_with_occurrence(self):
+        start_time = self.start_time + datetime.timedelta(weeks=2, minutes=30)
+        with self.assertRaises(OverlapError):
+            Reservation.objects.create(owner=self.user, car=self.car, distance=1, location='Location',
+                                       start_time=start_time, end_time=start_time + datetime.timedelta(hours=1))
+
+    def test_series_overlaps_existing_reservation(self):
+        start_time = self.start_time + datetime.timedelta(days=1)
+        Reservation.objects.create(owner=self.user, car=self.car, distance=1, location='Location',
+                                   start_time=start_time + datetime.timedelta(days=2),
+                                   end_time=start_time + datetime.timedelta(days=2, hours=1))
+        with self.assertRaises(OverlapError):
+            Reservation.objects.create(owner=self.user, car=self.car, distance=1, location='Location',
+                                       start_time=start_time, end_time=start_time + datetime.timedelta(hours=1),
+                                       recurrence='FREQ=DAILY;COUNT=3')
+
+    def test_distance_left_counts_occurrences(self):
+        ChargingReservation.objects.create(car=self.car, start_time=self.start_time - datetime.timedelta(hours=4),
+                                           end_time=self.start_time)
+        time = self.start_time + datetime.timedelta(weeks=2, hours=2)
+        self.assertEqual(self.car.get_distance_left(time), 300 - 3 * 50)
+        self.assertEqual(BatteryTimeline(self.car, time, time).get_distance_left(time), 300 - 3 * 50)
+        self.assertEqual(self.car.get_distance_left(time, exclude_reservation_id=self.series.id), 300)
+
+    def get_form(self, start_time, recurrence):
+        return ReservationAddForm({
+            'distance': 10, 'location': 'Location', 'priority': Reservation.PRIORITY_LOW,
+            'start_time': start_time.strftime('%Y-%m-%d %H:%M'),
+            'end_time': (start_time + datetime.timedelta(hours=1)).strftime('%Y-%m-%d %H:%M'),
+            'recurrence': recurrence,
+        }, car=self.car, owner=self.user)
+
+    def test_occurrences_are_counted_from_the_start_time(self):
+        start_time = self.start_time + datetime.timedelta(days=1)
+        form = self.get_form(start_time, 'FREQ=DAILY;UNTIL=20270301T000000')
+        self.assertFalse(form.is_valid())
+        self.assertIn('recurrence', form.errors)
+
+        future_start_time = timezone.make_aware(datetime.datetime(2040, 1, 1, 8))
+        form = self.get_form(future_start_time, 'FREQ=DAILY;UNTIL=20400601T000000')
+        self.assertTrue(form.is_valid(), form.errors)
+
+
+class AvailabilityTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='user', password='password')
+        self.client.login(username='user', password='password')
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3, 8))
+        self.cars = {}
+        for name in ('Busy', 'Driven', 'Full', 'Other'):
+            self.cars[name] = create_car(name)
+            if name != 'Other':
+                self.cars[name].users.add(self.user)
+        Reservation.objects.create(owner=self.user, car=self.cars['Busy'], distance=10, location='Location',
+                                   start_time=self.start_time - datetime.timedelta(days=7),
+                                   end_time=self.start_time - datetime.timedelta(days=7, hours=-1),
+                                   recurrence='FREQ=WEEKLY;COUNT=2')
+        Reservation.objects.create(owner=self.user, car=self.cars['Driven'], distance=250, location='Location',
+                                   start_time=self.start_time - datetime.timedelta(hours=3),
+                                   end_time=self.start_time - datetime.timedelta(hours=2))
+
+    def get(self, distance):
+        return self.client.get('/api/availability/', {
+            'start': self.start_time.isoformat(),
+            'end': (self.start_time + datetime.timedelta(hours=2)).isoformat(),
+            'distance': distance,
+        })
+
+    def test_ranking(self):
+        response = self.get(100)
+        self.assertEqual([(car['name'], car['available'], car['distance_left']) for car in response.json()],
+                         [('Full', True, 300), ('Driven', False, 50), ('Busy', False, None)])
+
+    def test_busy_cars_with_one_query(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.get(0)
+        busy_queries = [query for query in queries if 'UNION' in query['sql'] and ' IN (' in query['sql']]
+        self.assertEqual(len(busy_queries), 1)
+
+    def test_invalid_window(self):
+        response = self.client.get('/api/availability/', {
+            'start': self.start_time.isoformat(),
+            'end': self.start_time.isoformat(),
+        })
+        self.assertEqual(response.status_code, 400)
+
+
+class ChargingSchedulerTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        self.start_time = timezone.make_aware(datetime.datetime(2019, 6, 3))
+        self.add_reservation(8, 10, 200)
+        self.add_reservation(18, 20, 150)
+        self.add_reservation(24 + 9, 24 + 10, 10, should_be_charged_fully=True)
+        self.kept = self.add_charging_reservation(11, 15)
+        self.removed = self.add_charging_reservation(2 * 24 + 14, 2 * 24 + 18)
+
+    def at(self, hours):
+        return self.start_time + datetime.timedelta(hours=hours)
+
+    def add_reservation(self, start_hours, end_hours, distance, **kwargs):
+        return Reservation.objects.create(owner=self.user, car=self.car, distance=distance, location='Location',
+                                          start_time=self.at(start_hours), end_time=self.at(end_hours), **kwargs)
+
+    def add_charging_reservation(self, start_hours, end_hours):
+        return ChargingReservation.objects.create(car=self.car, start_time=self.at(start_hours),
+                                                  end_time=self.at(end_hours))
+
+    def test_plan(self):
+        scheduler = ChargingScheduler(self.car, self.start_time, self.at(7 * 24))
+        with self.assertNumQueries(0):
+            schedule = scheduler.plan()
+        self.assertEqual(schedule.keep, [self.kept])
+        self.assertEqual(schedule.add, [(self.at(24 + 4.5), self.at(24 + 8.5))])
+        self.assertEqual(schedule.remove, [self.removed])
+        self.assertEqual(schedule.unmet, [])
+
+    def test_unmet(self):
+        self.add_reservation(3 * 24 + 10, 3 * 24 + 11, 200, priority=Reservation.PRIORITY_LOW)
+        reservation = self.add_reservation(3 * 24 + 11, 3 * 24 + 12, 200, priority=Reservation.PRIORITY_HIGH)
+        schedule = schedule_charging(self.car, self.start_time, self.at(7 * 24), dry_run=True)
+        self.assertEqual([(entry.reservation_id, entry.reason) for entry in schedule.unmet],
+                         [(reservation.id, 'not_enough_distance_left')])
+
+    def test_apply(self):
+        schedule_charging(self.car, self.start_time, self.at(7 * 24))
+        self.assertEqual(list(self.car.chargingreservation_set.order_by('start_time')
+                              .values_list('start_time', 'end_time')),
+                         [(self.at(11), self.at(15)), (self.at(24 + 4.5), self.at(24 + 8.5))])
+        for reservation in self.car.reservation_set.all():
+            self.assertGreaterEqual(self.car.get_distance_left(reservation.start_time), reservation.distance)
+
+    def test_dry_run_api(self):
+        response = self.client.get(f'/api/car/{self.car.id}/charging_schedule/', {
+            'start': self.start_time.isoformat(),
+            'end': self.at(7 * 24).isoformat(),
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['add']), 1)
+        self.assertEqual(self.car.chargingreservation_set.count(), 2)
+
+    def test_dry_run_command(self):
+        out = io.StringIO()
+        call_command('schedule_charging', self.car.id, '--start', self.start_time.isoformat(), '--days', '7',
+                     '--dry-run', stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line[0] for line in lines[:3]], [' ', '+', '-'])
+        self.assertEqual(lines[-1], "1 charges added, 1 removed, 1 kept (dry run)")
+        self.assertEqual(self.car.chargingreservation_set.count(), 2)
+
+
+class SeasonDrivingRangeTest(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.car = create_car()
+
+    def get_driving_range(self, month, day, year=2019):
+        return self.car.get_driving_range(timezone.make_aware(datetime.datetime(year, month, day, 12)))
+
+    def test_curve(self):
+        self.assertEqual(len(self.car.get_range_curve()), 366)
+        self.assertEqual(self.get_driving_range(1, 15), 200)
+        self.assertEqual(self.get_driving_range(6, 15), 300)
+        self.assertEqual(self.get_driving_range(12, 15), 200)
+        self.assertEqual(self.get_driving_range(2, 29, year=2020), 200)
+
+    def test_interpolation(self):
+        self.assertEqual(self.get_driving_range(4, 1), 250)
+        self.assertLessEqual(abs(self.get_driving_range(3, 31) - self.get_driving_range(4, 1)), 4)
+        self.assertLess(self.get_driving_range(9, 30), 300)
+        self.assertGreater(self.get_driving_range(10, 1), 200)
+
+    def test_saving_the_car_rebuilds_the_curve(self):
+        self.assertIs(self.car.get_range_curve(), Car.objects.get(id=self.car.id).get_range_curve())
+        self.car.summer_driving_range = 400
+        self.car.save()
+        self.assertEqual(Car.objects.get(id=self.car.id).get_driving_range(
+            timezone.make_aware(datetime.datetime(2019, 6, 15))), 400)
+
+    @override_settings(DRIVING_RANGE_TEMPERATURES=[2, 3, 6, 9, 13, 15, 18, 18, 15, 11, 7, 4])
+    def test_temperatures(self):
+        self.assertEqual(self.get_driving_range(1, 15), 200)
+        self.assertEqual(self.get_driving_range(7, 15), 300)
+        self.assertEqual(self.get_driving_range(5, 15), 269)
+        self.assertNotEqual(self.car.get_range_curve(), get_range_curve(300, 200))
+
+
+class AssetBundleTest(CarUserTestCase):
+    def setUp(self):
+        super().setUp()
+        static_root = tempfile.TemporaryDirectory()
+        self.addCleanup(static_root.cleanup)
+        self.static_root = static_root.name
+
+    def get_calendar(self):
+        return self.client.get(f'/calendar/{self.car.id}/').content.decode()
+
+    def test_build(self):
+        with self.settings(STATIC_ROOT=self.static_root):
+            out = io.StringIO()
+            call_command('build_assets', stdout=out, stderr=io.StringIO())
+            manifest = build_bundles()
+            self.assertIn(manifest['calendar.js'], out.getvalue())
+            self.assertRegex(manifest['calendar.js'], rf'^{BUNDLE_DIR}/calendar\.[0-9a-f]{{12}}\.js$')
+
+            path = os.path.join(self.static_root, manifest['calendar.js'])
+            with open(path, 'rb') as f:
+                content = f.read()
+            with gzip.open(f'{path}.gz') as f:
+                self.assertEqual(f.read(), content)
+            self.assertIn(b'FullCalendarLocales.nl', content)
+            self.assertNotIn(b'code: "de"', content)
+
+            calendar = self.get_calendar()
+            self.assertIn(f'<script src="/static/{manifest["calendar.js"]}"></script>', calendar)
+            self.assertIn(f'<link rel="stylesheet" href="/static/{manifest["calendar.css"]}">', calendar)
+            self.assertNotIn('fullcalendar/', calendar)
+
+    def test_separate_files_before_the_build(self):
+        with self.settings(STATIC_ROOT=self.static_root):
+            calendar = self.get_calendar()
+        self.assertIn('<script src="/static/reservation/fullcalendar/core/main.min.js"></script>', calendar)
+        self.assertIn('/static/reservation/fullcalendar/core/locales/nl.js', calendar)
+        self.assertNotIn('bundles/', calendar)
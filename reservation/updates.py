@@ -0,0 +1,106 @@
+import json
+import queue
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from reservation.models import Reservation, ChargingReservation
+
+# How long a stream stays open before the browser reconnects, how often it sends a keepalive comment and how often
+# it looks for changes
+STREAM_DURATION = 60
+HEARTBEAT_INTERVAL = 15
+POLL_INTERVAL = 1
+RETRY_MILLISECONDS = 2000
+
+
+class Subscription:
+    def __init__(self, broker, car_id, last_event_id=None):
+        self.broker = broker
+        self.car_id = car_id
+        self.current_event_id = broker.get_event_id(car_id)
+        # A stream that reconnects with another id missed a change
+        self.last_event_id = self.current_event_id if last_event_id is None else last_event_id
+
+    def get(self, timeout):
+        """Return the id of the latest change the stream hasn't seen, raise queue.Empty when none comes in time."""
+        deadline = time.monotonic() + timeout
+        while True:
+            event_id = self.broker.get_event_id(self.car_id)
+            if event_id != self.last_event_id:
+                self.last_event_id = event_id
+                return event_id
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise queue.Empty
+            time.sleep(min(self.broker.poll_interval, remaining))
+
+
+class Broker:
+    """
+    Tells the open update streams of a car that its bookings changed.
+
+    The changes of a car are counted in the cache, so the streams of every worker process see them, and the count is
+    the id of the last change. A change can move the distance left of every later booking, so the calendar refetches
+    its events instead of applying the change itself.
+    """
+
+    def __init__(self, poll_interval=POLL_INTERVAL):
+        self.poll_interval = poll_interval
+
+    def get_key(self, car_id):
+        return f'reservation:car:{car_id}:updates'
+
+    def get_event_id(self, car_id):
+        event_id = cache.get(self.get_key(car_id))
+        if event_id is None:
+            # Start from the current time, so an id from before an eviction is never reused
+            cache.add(self.get_key(car_id), time.time_ns(), None)
+            event_id = cache.get(self.get_key(car_id))
+        return str(event_id)
+
+    def publish(self, car_id):
+        try:
+            cache.incr(self.get_key(car_id))
+        except ValueError:
+            cache.set(self.get_key(car_id), time.time_ns(), None)
+
+    def subscribe(self, car_id, last_event_id=None):
+        return Subscription(self, car_id, last_event_id)
+
+
+broker = Broker()
+
+
+def format_event(event_id):
+    return f'id: {event_id}\nevent: reset\ndata: {json.dumps({"action": "reset"})}\n\n'
+
+
+def iter_updates(car_id, last_event_id=None):
+    """Yield the changes of the bookings of a car as server-sent events until the stream duration is over."""
+    subscription = broker.subscribe(car_id, last_event_id)
+    if last_event_id is None:
+        # Without data this only sets the id the browser sends back when it reconnects
+        yield f'retry: {RETRY_MILLISECONDS}\nid: {subscription.current_event_id}\n\n'
+    else:
+        yield f'retry: {RETRY_MILLISECONDS}\n\n'
+    deadline = time.monotonic() + STREAM_DURATION
+    while time.monotonic() < deadline:
+        try:
+            event_id = subscription.get(timeout=min(HEARTBEAT_INTERVAL, deadline - time.monotonic()))
+        except queue.Empty:
+            yield ': keepalive\n\n'
+            continue
+        yield format_event(event_id)
+
+
+@receiver(post_save, sender=Reservation)
+@receiver(post_save, sender=ChargingReservation)
+@receiver(post_delete, sender=Reservation)
+@receiver(post_delete, sender=ChargingReservation)
+def publish_booking_change(sender, instance, **kwargs):
+    car_id = instance.car_id
+    transaction.on_commit(lambda: broker.publish(car_id))
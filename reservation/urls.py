@@ -22,8 +22,18 @@ urlpatterns = [
     path('car/<int:car_id>/charging_reservation/add/', views.ChargingReservationAdd.as_view(),
          name='charging_reservation_add'),
 
+    path('car/<int:pk>/feed.ics', views.CarFeed.as_view(), name='car_feed'),
+
     path('api/car/<int:pk>/reservations/', views.APIReservationsList.as_view(), name='api_car_reservations'),
+    path('api/car/<int:pk>/reservations/bulk/', views.BulkReservations.as_view(), name='api_car_reservations_bulk'),
     path('api/car/<int:pk>/charging_reservations/', views.APIChargingReservationsList.as_view(),
          name='api_car_charging_reservations'),
     path('api/car/<int:pk>/distance_left/', views.DistanceLeft.as_view(), name='api_car_distance_left'),
+    path('api/car/<int:pk>/events/', views.APICarEvents.as_view(), name='api_car_events'),
+    path('api/car/<int:pk>/updates/', views.CarUpdates.as_view(), name='api_car_updates'),
+    path('api/car/<int:pk>/distance_profile/', views.DistanceProfile.as_view(), name='api_car_distance_profile'),
+    path('api/car/<int:pk>/charging_schedule/', views.ChargingSchedule.as_view(), name='api_car_charging_schedule'),
+
+    path('api/availability/', views.Availability.as_view(), name='api_availability'),
+    path('api/metrics/', views.Metrics.as_view(), name='api_metrics'),
 ]
@@ -1,4 +1,5 @@
 import datetime
+import hashlib
 
 import dateutil.parser
 from django.contrib import messages
@@ -6,19 +7,68 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.messages.views import SuccessMessageMixin
 from django.db.models import Q
-from django.http import JsonResponse
-from django.shortcuts import redirect
+from django.http import JsonResponse, StreamingHttpResponse, Http404
+from django.shortcuts import redirect, get_object_or_404
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
 from django.views import View
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
 from django.views.generic import UpdateView, CreateView, DeleteView, TemplateView, FormView
 from django.views.generic.detail import SingleObjectMixin, DetailView
 from django.utils.translation import gettext as _
 from rest_framework import generics
-
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from reservation.availability import get_availability
+from reservation.battery import BatteryTimeline, get_distance_left_for_reservations
+from reservation.bulk import FORMATS, BulkFormatError, import_reservations, iter_export, parse_rows
+from reservation.cache import get_or_set_for_car, get_car_generation
 from reservation.forms import ReservationDetailForm, ReservationAddForm, ChargingReservationAddForm, \
     ChargingReservationDetailForm, UserConfigForm
-from reservation.models import Car, Reservation, ChargingReservation
-from reservation.serializers import ReservationSerializer, ChargingReservationSerializer
+from reservation.ical import get_feed_token, get_feed_user_id, iter_calendar
+from reservation.metrics import get_metrics, timed_serializer
+from reservation.models import Car, Reservation, ChargingReservation, OverlapError, expand_reservations, \
+    occurring, overlapping
+from reservation.permissions import has_car, get_car_ids, get_car_ids_for_user
+from reservation.scheduler import DEFAULT_HORIZON, schedule_charging, serialize_schedule
+from reservation.serializers import ReservationSerializer, ChargingReservationSerializer, \
+    ReservationEventSerializer, ChargingReservationEventSerializer
+from reservation.updates import iter_updates
+
+
+def parse_time(value):
+    time = dateutil.parser.parse(value)
+    if timezone.is_naive(time):
+        time = timezone.make_aware(time)
+    return time
+
+
+def get_time_window(request):
+    return parse_time(request.GET['start']), parse_time(request.GET['end'])
+
+
+def get_car_etag(request, pk, *args, **kwargs):
+    representation = f"{request.get_full_path()} {request.META.get('HTTP_ACCEPT', '')}"
+    return f"{get_car_generation(pk)}-{hashlib.sha1(representation.encode()).hexdigest()}"
+
+
+def get_distance_left_time(request):
+    if 'time' in request.GET:
+        return datetime.datetime.fromtimestamp(int(request.GET['time']), tz=datetime.timezone.utc)
+    return timezone.now().replace(microsecond=0, second=0, minute=0)
+
+
+def get_distance_left_etag(request, pk, *args, **kwargs):
+    # Without a time the answer is for the current hour, so the tag has to change with it
+    return f"{get_car_etag(request, pk)}-{int(get_distance_left_time(request).timestamp())}"
+
+
+# Let clients revalidate the car API responses with If-None-Match instead of downloading them again
+car_api_conditional_get = [cache_control(private=True, no_cache=True), condition(etag_func=get_car_etag)]
 
 
 def index(request):
@@ -28,6 +78,38 @@ def index(request):
         return redirect('login')
 
 
+class CachedObjectMixin:
+    """Look up the object of the URL once and reuse it for the rest of the request."""
+
+    def get_object(self, queryset=None):
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+
+class BookingFormMixin:
+    def form_valid(self, form):
+        try:
+            return super().form_valid(form)
+        except OverlapError:
+            form.add_error(None, _("Reservation overlaps with another reservation"))
+            return self.form_invalid(form)
+
+
+class ReservationFormMixin(BookingFormMixin):
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        if form.result is not None and form.result.charging_reservation is not None:
+            messages.info(
+                self.request,
+                _("We automatically added a charging reservation at %(charging_time)s.")
+                % {'charging_time': form.result.charging_reservation.start_time.strftime('%d %b %Y %H:%M:%S')}
+            )
+        return response
+
+
 class UserSettings(LoginRequiredMixin, SuccessMessageMixin, FormView):
     template_name = 'reservation/user_settings.html'
     form_class = UserConfigForm
@@ -63,17 +145,19 @@ class CalendarCar(LoginRequiredMixin, UserPassesTestMixin, DetailView):
     template_name = 'reservation/calendar.html'
 
     def test_func(self):
-        return self.get_object() in self.request.user.car_set.all()
+        return has_car(self.request, self.kwargs['pk'])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['all_cars'] = self.request.user.car_set.all()
+        feed_url = reverse('reservation:car_feed', kwargs={'pk': self.object.id})
+        context['feed_url'] = 'webcal://' + self.request.get_host() + feed_url + '?token=' + \
+            get_feed_token(self.request.user, self.object)
         return context
 
     def get(self, *args, **kwargs):
         response = super().get(*args, **kwargs)
-        self.request.user.profile.last_car = self.get_object()
-        self.request.user.profile.save()
+        self.request.user.profile.set_last_car(self.object)
         return response
 
 
@@ -87,54 +171,53 @@ class CarConfig(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, Up
         return reverse('reservation:calendar_car', kwargs={'pk': self.kwargs['pk']})
 
     def test_func(self):
-        return self.request.user.car_set.filter(pk=self.kwargs['pk']).exists()
+        return has_car(self.request, self.kwargs['pk'])
 
 
-class ReservationDetail(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, UpdateView):
+class ReservationDetail(LoginRequiredMixin, UserPassesTestMixin, CachedObjectMixin, ReservationFormMixin,
+                        SuccessMessageMixin, UpdateView):
     template_name = 'reservation/reservation_detail.html'
-    model = Reservation
+    queryset = Reservation.objects.select_related('car', 'owner')
     form_class = ReservationDetailForm
     success_message = _('Reservation saved successfully.')
 
     def test_func(self):
-        car_id = self.get_object().car.id
-        return self.request.user.car_set.filter(pk=car_id).exists()
+        return has_car(self.request, self.get_object().car_id)
 
     def get_success_url(self):
-        return reverse('reservation:calendar_car', kwargs={'pk': self.get_object().car.id})
+        return reverse('reservation:calendar_car', kwargs={'pk': self.object.car_id})
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
-        kwargs['car'] = self.get_object().car
-        kwargs['owner'] = self.get_object().owner
-        kwargs['id'] = self.get_object().id
-        kwargs['request'] = self.request
+        kwargs['car'] = self.object.car
+        kwargs['owner'] = self.object.owner
+        kwargs['id'] = self.object.id
         return kwargs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['car'] = self.get_object().car
+        context['car'] = self.object.car
         context['reservation_type'] = 'reservation'
         return context
 
 
-class ReservationDelete(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, DeleteView):
-    model = Reservation
+class ReservationDelete(LoginRequiredMixin, UserPassesTestMixin, CachedObjectMixin, SuccessMessageMixin, DeleteView):
+    queryset = Reservation.objects.select_related('car')
     success_message = _('Reservation deleted successfully.')
 
     def test_func(self):
-        car_id = self.get_object().car.id
-        return self.request.user.car_set.filter(pk=car_id).exists()
+        return has_car(self.request, self.get_object().car_id)
 
     def delete(self, request, *args, **kwargs):
         messages.success(self.request, self.success_message)
         return super(ReservationDelete, self).delete(request, *args, **kwargs)
 
     def get_success_url(self):
-        return reverse('reservation:calendar_car', kwargs={'pk': self.get_object().car.id})
+        return reverse('reservation:calendar_car', kwargs={'pk': self.object.car_id})
 
 
-class ReservationAdd(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, CreateView):
+class ReservationAdd(LoginRequiredMixin, UserPassesTestMixin, ReservationFormMixin, SuccessMessageMixin,
+                     CreateView):
     template_name = 'reservation/reservation_detail.html'
     model = Reservation
     form_class = ReservationAddForm
@@ -145,7 +228,7 @@ class ReservationAdd(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixi
         self.car = Car.objects.get(pk=self.kwargs['car_id'])
 
     def test_func(self):
-        return self.request.user.car_set.filter(pk=self.car.id).exists()
+        return has_car(self.request, self.car.id)
 
     def get_initial(self):
         initial = super().get_initial()
@@ -167,7 +250,6 @@ class ReservationAdd(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixi
         kwargs = super().get_form_kwargs()
         kwargs['car'] = self.car
         kwargs['owner'] = self.request.user
-        kwargs['request'] = self.request
         return kwargs
 
     def get_context_data(self, **kwargs):
@@ -177,49 +259,50 @@ class ReservationAdd(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixi
         return context
 
 
-class ChargingReservationDetail(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, UpdateView):
+class ChargingReservationDetail(LoginRequiredMixin, UserPassesTestMixin, CachedObjectMixin, BookingFormMixin,
+                                SuccessMessageMixin, UpdateView):
     template_name = 'reservation/reservation_detail.html'
-    model = ChargingReservation
+    queryset = ChargingReservation.objects.select_related('car')
     form_class = ChargingReservationDetailForm
     success_message = _('Reservation saved successfully.')
 
     def test_func(self):
-        car_id = self.get_object().car.id
-        return self.request.user.car_set.filter(pk=car_id).exists()
+        return has_car(self.request, self.get_object().car_id)
 
     def get_success_url(self):
-        return reverse('reservation:calendar_car', kwargs={'pk': self.get_object().car.id})
+        return reverse('reservation:calendar_car', kwargs={'pk': self.object.car_id})
 
     def get_form_kwargs(self):
         kwargs = super().get_form_kwargs()
-        kwargs['car'] = self.get_object().car
-        kwargs['id'] = self.get_object().id
+        kwargs['car'] = self.object.car
+        kwargs['id'] = self.object.id
         return kwargs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['reservation_type'] = 'charging_reservation'
-        context['car'] = self.get_object().car
+        context['car'] = self.object.car
         return context
 
 
-class ChargingReservationDelete(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, DeleteView):
-    model = ChargingReservation
+class ChargingReservationDelete(LoginRequiredMixin, UserPassesTestMixin, CachedObjectMixin, SuccessMessageMixin,
+                                DeleteView):
+    queryset = ChargingReservation.objects.select_related('car')
     success_message = _('Reservation deleted successfully.')
 
     def test_func(self):
-        car_id = self.get_object().car.id
-        return self.request.user.car_set.filter(pk=car_id).exists()
+        return has_car(self.request, self.get_object().car_id)
 
     def delete(self, request, *args, **kwargs):
         messages.success(self.request, self.success_message)
         return super(ChargingReservationDelete, self).delete(request, *args, **kwargs)
 
     def get_success_url(self):
-        return reverse('reservation:calendar_car', kwargs={'pk': self.get_object().car.id})
+        return reverse('reservation:calendar_car', kwargs={'pk': self.object.car_id})
 
 
-class ChargingReservationAdd(LoginRequiredMixin, UserPassesTestMixin, SuccessMessageMixin, CreateView):
+class ChargingReservationAdd(LoginRequiredMixin, UserPassesTestMixin, BookingFormMixin, SuccessMessageMixin,
+                             CreateView):
     template_name = 'reservation/reservation_detail.html'
     model = ChargingReservation
     form_class = ChargingReservationAddForm
@@ -230,7 +313,7 @@ class ChargingReservationAdd(LoginRequiredMixin, UserPassesTestMixin, SuccessMes
         self.car = Car.objects.get(pk=self.kwargs['car_id'])
 
     def test_func(self):
-        return self.request.user.car_set.filter(pk=self.car.id).exists()
+        return has_car(self.request, self.car.id)
 
     def get_initial(self):
         initial = super().get_initial()
@@ -260,47 +343,235 @@ class ChargingReservationAdd(LoginRequiredMixin, UserPassesTestMixin, SuccessMes
         return context
 
 
+@method_decorator([cache_control(private=True, no_cache=True), condition(etag_func=get_distance_left_etag)],
+                  name='get')
 class DistanceLeft(LoginRequiredMixin, UserPassesTestMixin, SingleObjectMixin, View):
     model = Car
 
     def test_func(self):
-        car_id = self.get_object().id
-        return self.request.user.car_set.filter(pk=car_id).exists()
+        return has_car(self.request, self.kwargs['pk'])
 
     def get(self, request, *args, **kwargs):
-        if 'time' in request.GET:
-            time = datetime.datetime.fromtimestamp(int(request.GET['time']))
-        else:
-            time = datetime.datetime.now().replace(microsecond=0, second=0, minute=0)
-        return JsonResponse({
-            'distance_left': self.get_object().get_distance_left(time),
-            'driving_range': self.get_object().get_driving_range(time)
-        })
+        time = get_distance_left_time(request)
+        return JsonResponse(get_or_set_for_car(self.kwargs['pk'], 'distance_left', [time],
+                                               lambda: self.serialize(time)))
+
+    def serialize(self, time):
+        car = self.get_object()
+        return {
+            'distance_left': car.get_distance_left(time),
+            'driving_range': car.get_driving_range(time)
+        }
 
 
+@method_decorator(car_api_conditional_get, name='get')
 class APIReservationsList(LoginRequiredMixin, UserPassesTestMixin, generics.ListAPIView):
     serializer_class = ReservationSerializer
 
     def test_func(self):
-        return self.request.user in Car.objects.get(pk=self.kwargs['pk']).users.all()
+        return has_car(self.request, self.kwargs['pk'])
+
+    def list(self, request, *args, **kwargs):
+        return Response(get_or_set_for_car(self.kwargs['pk'], 'reservations', get_time_window(request),
+                                           self.serialize))
+
+    @timed_serializer
+    def serialize(self):
+        start_time, end_time = get_time_window(self.request)
+        reservations = expand_reservations(self.filter_queryset(self.get_queryset()), start_time, end_time)
+
+        car = Car.objects.get(pk=self.kwargs['pk'])
+        serializer = self.get_serializer(reservations, many=True)
+        serializer.context['distance_left'] = get_distance_left_for_reservations(car, reservations)
+        return serializer.data
 
     def get_queryset(self):
-        start_time = dateutil.parser.parse(self.request.GET['start'])
-        end_time = dateutil.parser.parse(self.request.GET['end'])
+        start_time, end_time = get_time_window(self.request)
         return Reservation.objects. \
-            filter(Q(car__id=self.kwargs['pk']) &
-                   (Q(start_time__range=(start_time, end_time)) | Q(end_time__range=(start_time, end_time))))
+            filter(Q(car__id=self.kwargs['pk']) & occurring(start_time, end_time)). \
+            select_related('owner__profile', 'car')
 
 
+@method_decorator(car_api_conditional_get, name='get')
 class APIChargingReservationsList(LoginRequiredMixin, UserPassesTestMixin, generics.ListAPIView):
     serializer_class = ChargingReservationSerializer
 
     def test_func(self):
-        return self.request.user in Car.objects.get(pk=self.kwargs['pk']).users.all()
+        return has_car(self.request, self.kwargs['pk'])
+
+    def list(self, request, *args, **kwargs):
+        return Response(get_or_set_for_car(self.kwargs['pk'], 'charging_reservations', get_time_window(request),
+                                           self.serialize))
+
+    @timed_serializer
+    def serialize(self):
+        return self.get_serializer(self.filter_queryset(self.get_queryset()), many=True).data
 
     def get_queryset(self):
-        start_time = dateutil.parser.parse(self.request.GET['start'])
-        end_time = dateutil.parser.parse(self.request.GET['end'])
+        start_time, end_time = get_time_window(self.request)
         return ChargingReservation.objects. \
-            filter(Q(car__id=self.kwargs['pk']) &
-                   (Q(start_time__range=(start_time, end_time)) | Q(end_time__range=(start_time, end_time))))
+            filter(Q(car__id=self.kwargs['pk']) & overlapping(start_time, end_time))
+
+
+class CarAPIView(LoginRequiredMixin, UserPassesTestMixin, APIView):
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.car = Car.objects.get(pk=self.kwargs['pk'])
+
+    def test_func(self):
+        return has_car(self.request, self.car.id)
+
+
+@method_decorator(car_api_conditional_get, name='get')
+class APICarEvents(CarAPIView):
+    def get(self, request, *args, **kwargs):
+        return Response(get_or_set_for_car(self.car.id, 'events', get_time_window(request), self.serialize))
+
+    @timed_serializer
+    def serialize(self):
+        start_time, end_time = get_time_window(self.request)
+        reservations = expand_reservations(self.car.reservation_set
+                                           .filter(occurring(start_time, end_time))
+                                           .select_related('owner__profile', 'car'), start_time, end_time)
+        charging_reservations = self.car.chargingreservation_set.filter(overlapping(start_time, end_time))
+
+        context = {'request': self.request,
+                   'distance_left': get_distance_left_for_reservations(self.car, reservations)}
+        return ReservationEventSerializer(reservations, many=True, context=context).data + \
+            ChargingReservationEventSerializer(charging_reservations, many=True, context=context).data
+
+
+@method_decorator(car_api_conditional_get, name='get')
+class DistanceProfile(CarAPIView):
+    max_points = 5000
+
+    def get(self, request, *args, **kwargs):
+        start_time, end_time = get_time_window(request)
+        try:
+            step = datetime.timedelta(minutes=int(request.GET.get('step', 30)))
+        except ValueError:
+            raise ValidationError({'step': _("Step must be a positive number of minutes")})
+        if step <= datetime.timedelta(0):
+            raise ValidationError({'step': _("Step must be a positive number of minutes")})
+        if (end_time - start_time) / step > self.max_points:
+            raise ValidationError({'step': _("Step is too small for this time window")})
+
+        return Response(get_or_set_for_car(self.car.id, 'distance_profile', [start_time, end_time, step],
+                                           lambda: self.serialize(start_time, end_time, step)))
+
+    @timed_serializer
+    def serialize(self, start_time, end_time, step):
+        timeline = BatteryTimeline(self.car, start_time, end_time)
+        points = []
+        time = start_time
+        while time <= end_time:
+            points.append({
+                'time': time.isoformat(),
+                'distance_left': timeline.get_distance_left(time),
+                'driving_range': self.car.get_driving_range(time),
+            })
+            time += step
+        return points
+
+
+class ChargingSchedule(CarAPIView):
+    """Show the charges the scheduler would plan for the car with GET, and replace its charges with them on POST."""
+
+    def get(self, request, *args, **kwargs):
+        return Response(self.schedule(dry_run=True))
+
+    def post(self, request, *args, **kwargs):
+        return Response(self.schedule(dry_run='dry_run' in request.GET))
+
+    def schedule(self, dry_run):
+        start_time = parse_time(self.request.GET['start']) if 'start' in self.request.GET else timezone.now()
+        end_time = parse_time(self.request.GET['end']) if 'end' in self.request.GET else start_time + DEFAULT_HORIZON
+        if start_time >= end_time:
+            raise ValidationError({'end': _("End time must come after start time")})
+        return dict(serialize_schedule(schedule_charging(self.car, start_time, end_time, dry_run=dry_run)),
+                    dry_run=dry_run)
+
+
+class Availability(LoginRequiredMixin, APIView):
+    def get(self, request, *args, **kwargs):
+        start_time, end_time = get_time_window(request)
+        if start_time >= end_time:
+            raise ValidationError({'end': _("End time must come after start time")})
+        try:
+            distance = int(request.GET.get('distance', 0))
+        except ValueError:
+            raise ValidationError({'distance': _("Distance must be a number")})
+
+        cars = list(Car.objects.filter(pk__in=get_car_ids(request)))
+        return Response(self.serialize(cars, start_time, end_time, distance))
+
+    @timed_serializer
+    def serialize(self, cars, start_time, end_time, distance):
+        return get_availability(cars, start_time, end_time, distance)
+
+
+@method_decorator(car_api_conditional_get, name='get')
+class CarFeed(View):
+    # Calendar apps can't log in, the token in the URL identifies the user instead
+    def get(self, request, *args, **kwargs):
+        user_id = get_feed_user_id(self.kwargs['pk'], request.GET.get('token', ''))
+        if user_id is None or self.kwargs['pk'] not in get_car_ids_for_user(user_id):
+            raise Http404
+        car = get_object_or_404(Car, pk=self.kwargs['pk'])
+
+        response = StreamingHttpResponse(iter_calendar(car, request.get_host()),
+                                         content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = f'inline; filename="{car.id}.ics"'
+        return response
+
+
+class BulkReservations(LoginRequiredMixin, UserPassesTestMixin, View):
+    content_types = {'csv': 'text/csv; charset=utf-8', 'json': 'application/json'}
+
+    def setup(self, request, *args, **kwargs):
+        super().setup(request, *args, **kwargs)
+        self.car = get_object_or_404(Car, pk=self.kwargs['pk'])
+
+    def test_func(self):
+        return has_car(self.request, self.car.id)
+
+    def get(self, request, *args, **kwargs):
+        content_format = request.GET.get('format', 'json')
+        if content_format not in FORMATS:
+            raise Http404
+        response = StreamingHttpResponse(iter_export(self.car, content_format),
+                                         content_type=self.content_types[content_format])
+        response['Content-Disposition'] = f'attachment; filename="reservations-{self.car.id}.{content_format}"'
+        return response
+
+    def post(self, request, *args, **kwargs):
+        content_format = 'csv' if request.content_type == 'text/csv' else 'json'
+        try:
+            rows = parse_rows(request.body.decode(request.encoding or 'utf-8'), content_format)
+        except BulkFormatError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        report = import_reservations(self.car, request.user, rows, dry_run='dry_run' in request.GET)
+        return JsonResponse({'created': sum(entry['status'] == 'created' for entry in report), 'rows': report})
+
+
+class CarUpdates(LoginRequiredMixin, UserPassesTestMixin, View):
+    def test_func(self):
+        return has_car(self.request, self.kwargs['pk'])
+
+    def get(self, request, *args, **kwargs):
+        response = StreamingHttpResponse(iter_updates(self.kwargs['pk'], request.META.get('HTTP_LAST_EVENT_ID')),
+                                         content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        # GZipMiddleware leaves encoded responses alone; it would hold the events back in its buffer
+        response['Content-Encoding'] = 'identity'
+        return response
+
+
+class Metrics(LoginRequiredMixin, UserPassesTestMixin, View):
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(get_metrics())